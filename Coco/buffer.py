@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import os
-from typing import BinaryIO, Optional, Union
+import re
+from asyncio import StreamReader
+from array import array
+from bisect import bisect_right
+from mmap import mmap
+from typing import BinaryIO, Optional, Tuple, Union
 
 from .constants import COCO_WCHAR_MAX
 from .errors import FatalError
@@ -16,11 +21,12 @@ class Buffer:
         a) whole stream in buffer
         b) part of stream in buffer
     2) non seekable stream (network, console)
+    3) input already in memory (bytes, bytearray, mmap), used without copying
     """
     EOF: int = COCO_WCHAR_MAX + 1
     MIN_BUFFER_LENGTH: int = 1024  # 1KB
     MAX_BUFFER_LENGTH: int = MIN_BUFFER_LENGTH * 64  # 64 KB
-    buf: bytearray  # input buffer
+    buf: Union[bytearray, bytes, mmap]  # input buffer
     buf_start: int  # position of first byte in buffer relative to input stream
     buf_len: int    # length of buffer
     file_len: int   # length of input stream (may change if stream is no file)
@@ -28,13 +34,21 @@ class Buffer:
     file: Optional[BinaryIO]  # input stream (seekable)
     stream: BinaryIO  # growing input stream (e.g.: console, network)
 
-    def __init__(self, s: Union[str, BinaryIO, 'Buffer']):
-        assert isinstance(s, (str, BinaryIO, Buffer))
-        if isinstance(s, BinaryIO):
+    def __init__(self, s: Union[str, BinaryIO, bytes, bytearray, mmap, 'Buffer']):
+        assert isinstance(s, (str, BinaryIO, bytes, bytearray, mmap, Buffer))
+        if isinstance(s, (bytes, bytearray, mmap)):
+            self.stream = None
+            self.file = None
+            self.buf = s
+            self.file_len = self.buf_len = len(s)
+            self.buf_start = self.buf_pos = 0
+        elif isinstance(s, BinaryIO):
             self.stream = s
+            self.file = None
             self.file_len = self.buf_len = self.buf_start = self.buf_pos = 0
             self.buf = bytearray(self.MIN_BUFFER_LENGTH)
         elif isinstance(s, str):
+            self.stream = None
             try:
                 self.file_len = os.path.getsize(s)
                 self.file = open(s, "rb")
@@ -87,14 +101,48 @@ class Buffer:
         self.set_pos(cur_pos)
         return ch
 
-    def get_string(self, beg: int, end: int) -> str:
+    def get_bytes(self, beg: int, end: int) -> bytes:
+        """ Returns the raw input bytes between positions beg and end
+        """
+        if self.buf_start <= beg and end <= self.buf_start + self.buf_len:  # slice it from the buffer
+            return bytes(self.buf[beg - self.buf_start: end - self.buf_start])
+
+        if self.file is not None:
+            try:
+                self.file.seek(beg)
+                return self.file.read(end - beg)
+            except OSError as e:
+                raise FatalError(e.strerror)
+
         buf = bytearray()
         old_pos = self.get_pos()
         self.set_pos(beg)
         while self.get_pos() < end:
-            buf.append(self.read())
+            buf.append(Buffer.read(self))  # byte-wise, even for UTF8Buffer
         self.set_pos(old_pos)
-        return buf.decode('utf-8')
+        return bytes(buf)
+
+    def get_string(self, beg: int, end: int) -> str:
+        """ Text of the bytes beg..end as the scanner reads it: one char per byte
+        """
+        return self.get_bytes(beg, end).decode('latin-1')
+
+    def get_source(self, beg: int, end: int) -> str:
+        """ Source text of the bytes beg..end decoded as UTF-8, also if the scanner
+        reads one char per byte (no byte order mark), e.g. for types in attributes
+        """
+        return self.get_bytes(beg, end).decode('utf-8')
+
+    @staticmethod
+    def char_count(data: bytes) -> int:
+        """ Number of characters encoded in data
+        """
+        return len(data)
+
+    def to_utf8(self) -> 'Buffer':
+        """ A buffer over the same input that decodes UTF-8
+        """
+        return UTF8Buffer(self)
 
     def get_pos(self) -> int:
         return self.buf_pos + self.buf_start
@@ -150,12 +198,25 @@ class Buffer:
 
 
 class UTF8Buffer(Buffer):
+    UTF8_CONTINUATION: bytes = bytes(range(0x80, 0xC0))
+
     def __init__(self, b: Buffer):
         super().__init__(b)
 
+    @staticmethod
+    def char_count(data: bytes) -> int:
+        # every char has exactly one byte that is not a 10xxxxxx continuation byte
+        return len(data.translate(None, UTF8Buffer.UTF8_CONTINUATION))
+
+    def to_utf8(self) -> 'Buffer':
+        return self
+
+    def get_string(self, beg: int, end: int) -> str:
+        return self.get_bytes(beg, end).decode('utf-8')
+
     def read(self) -> int:
-        ch: int = 0xFF
-        while (ch >= 128) and ((ch & 0xC0) != 0xC0) and (ch != self.EOF):
+        ch: int = super().read()
+        while (ch >= 128) and ((ch & 0xC0) != 0xC0) and (ch != self.EOF):  # skip stray continuation bytes
             ch = super().read()
 
         if ch < 128 or ch == self.EOF:
@@ -187,3 +248,128 @@ class UTF8Buffer(Buffer):
             ch = (c1 << 6) | c2
 
         return ch
+
+
+# -----------------------------------------------------------------------------------
+# AsyncBuffer
+# -----------------------------------------------------------------------------------
+class NeedMoreData(Exception):
+    """ Raised by an AsyncBuffer that is asked for input that has not arrived yet
+    """
+
+
+class AsyncBuffer(Buffer):
+    """ Buffer over an asyncio StreamReader. Reading never blocks: if the input
+    received so far is used up, read() raises NeedMoreData and the owner has to
+    await fill() and start over from a position it saved before
+    """
+    reader: StreamReader
+    at_eof: bool  # the reader has no more input
+
+    def __init__(self, s: Union[StreamReader, 'AsyncBuffer']):
+        if isinstance(s, AsyncBuffer):
+            super().__init__(s)
+            self.reader = s.reader
+            self.at_eof = s.at_eof
+        else:
+            self.reader = s
+            self.at_eof = False
+            self.stream = None
+            self.file = None
+            self.buf = bytearray()
+            self.file_len = self.buf_len = self.buf_start = self.buf_pos = 0
+
+    def read(self) -> int:
+        if self.buf_pos < self.buf_len:
+            result = self.buf[self.buf_pos]
+            self.buf_pos += 1
+            return result
+
+        if self.at_eof:
+            return self.EOF
+        raise NeedMoreData()
+
+    def set_pos(self, value: int):
+        if value < self.buf_start:
+            raise FatalError("buffer position {} has already been released".format(value))
+        super().set_pos(value)
+
+    def to_utf8(self) -> 'Buffer':
+        return AsyncUTF8Buffer(self)
+
+    async def fill(self, keep_from: int) -> int:
+        """ Waits for more input and appends it to the buffer. The input in front of
+        position keep_from is not needed any more and is released.
+        Returns the number of bytes received, 0 at the end of the input
+        """
+        n = keep_from - self.buf_start
+        if n > 0:
+            del self.buf[:n]
+            self.buf_start += n
+            self.buf_pos -= n
+            self.buf_len -= n
+
+        data = await self.reader.read(self.MAX_BUFFER_LENGTH)
+        if not data:
+            self.at_eof = True
+        else:
+            self.buf += data
+            self.buf_len += len(data)
+            self.file_len += len(data)
+
+        return len(data)
+
+
+class AsyncUTF8Buffer(UTF8Buffer, AsyncBuffer):
+    """ AsyncBuffer that decodes UTF-8
+    """
+
+
+# -----------------------------------------------------------------------------------
+# LineIndex
+# -----------------------------------------------------------------------------------
+class LineIndex:
+    """ Maps byte positions of a buffer to (line, column) pairs.
+    The offsets of all line starts are collected with one regex pass over
+    the input, so the scanner does not need to count lines per character.
+    Lines and columns start at 1, columns are counted in characters.
+    """
+    EOL_RE = re.compile(rb'\r\n|\r|\n')  # '\r\n' is one EOL, an isolated '\r' is an EOL too
+    UTF8_BOM: bytes = b'\xef\xbb\xbf'
+
+    buffer: Buffer
+    starts: array   # byte positions where lines begin
+    indexed: int    # number of input bytes indexed so far
+
+    def __init__(self, buffer: Buffer):
+        self.buffer = buffer
+        # the byte order mark is not part of the first line
+        first = len(self.UTF8_BOM) if buffer.get_bytes(0, min(3, buffer.file_len)) == self.UTF8_BOM else 0
+        self.starts = array('i', [first])
+        self.indexed = first
+        self.update()
+
+    def update(self):
+        """ Indexes input that arrived since the last call (growing streams)
+        """
+        end = self.buffer.file_len
+        if end <= self.indexed:
+            return
+
+        data = self.buffer.get_bytes(self.indexed, end)
+        if data.endswith(b'\r') and self.buffer.stream is not None:
+            data = data[:-1]  # might be the first half of a '\r\n' that has not arrived yet
+
+        self.starts.extend(m.end() + self.indexed for m in self.EOL_RE.finditer(data))
+        self.indexed += len(data)
+
+    def line_col(self, pos: int) -> Tuple[int, int]:
+        if pos >= self.indexed:
+            self.update()
+
+        line = bisect_right(self.starts, pos)
+        if line == 0:  # inside the byte order mark
+            return 1, 1
+
+        start = self.starts[line - 1]
+        return line, self.buffer.char_count(self.buffer.get_bytes(start, pos)) + 1
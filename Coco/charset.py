@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from typing import List
+from typing import Iterable, List
 
 from .constants import COCO_WCHAR_MAX
 
@@ -24,7 +24,7 @@ class Range:
 
     def __eq__(self, other):
         assert isinstance(other, Range)
-        return self.from_, self.to == other.from_, other.to
+        return self.from_ == other.from_ and self.to == other.to
 
 
 class CharSet:
@@ -43,10 +43,10 @@ class CharSet:
     def set(self, i: int):
         jj = 0
         for jj, cur in enumerate(self.ranges):
-            if i >= cur.from_ - 1:
+            if i < cur.from_ - 1:
                 break
 
-            if i <= cur.to + 1:
+            if i <= cur.to + 1:  # cur.from_ - 1 <= i <= cur.to + 1
                 if i == cur.from_ - 1:
                     cur.from_ -= 1
                 elif i == cur.to + 1:
@@ -56,8 +56,9 @@ class CharSet:
                         if cur.to == next_.from_ - 1:
                             cur.to = next_.to
                             self.ranges.pop(jj + 1)
-                            continue
-            return
+                return
+        else:
+            jj = len(self.ranges)
 
         self.ranges.insert(jj, Range(i, i))
 
@@ -80,9 +81,21 @@ class CharSet:
 
     def or_(self, other: 'CharSet'):
         assert isinstance(other, CharSet)
-        for range_ in other.ranges:
-            for i in range_:
-                self.set(i)
+        self.ranges = CharSet.union([self, other]).ranges
+
+    @staticmethod
+    def union(sets: Iterable['CharSet']) -> 'CharSet':
+        """ Union of all sets, computed by merging their ranges
+        """
+        result = CharSet()
+        for r in sorted(((r.from_, r.to) for s in sets for r in s.ranges), key=lambda x: x[0]):
+            if result.ranges and r[0] <= result.ranges[-1].to + 1:
+                last = result.ranges[-1]
+                last.to = max(last.to, r[1])
+            else:
+                result.ranges.append(Range(r[0], r[1]))
+
+        return result
 
     def and_(self, other):
         assert isinstance(other, CharSet)
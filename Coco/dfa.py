@@ -1,22 +1,20 @@
 # -*- coding: utf-8 -*-
 
-from typing import List, BinaryIO, TextIO, Optional, Set, Any, Generator
+import os
+from array import array
+from bisect import bisect_right
+from heapq import heappush, heappop
+from typing import List, BinaryIO, TextIO, Optional, Set, Any, Tuple, Dict, FrozenSet, Iterable, Iterator, TYPE_CHECKING
 
 from .tab import Node, Symbol, Tab
-from .charset import CharSet
-from .parser import Parser
+from .charset import CharSet, Range
+from .tables import ScannerTables, fast_comment_args
 from .errors import Errors, FatalError
 from .trace import Trace
 from .generator import Generator as Generator_
 
-
-class Target:
-    state: 'State'
-    next: Optional['State']
-
-    def __init__(self, state: 'State'):
-        self.state = state
-        self.next = None
+if TYPE_CHECKING:  # parser imports dfa
+    from .parser import Parser
 
 
 class Comment:
@@ -33,34 +31,21 @@ class Action:
     typ: int
     sym: int
     tc: int
-    target: Optional[Target]
+    targets: Tuple['State', ...]  # target states without duplicates, sorted by state number
 
-    def __init__(self, typ: int, sym: int, tc: int):
+    def __init__(self, typ: int, sym: int, tc: int, targets: Tuple['State', ...] = ()):
         self.typ = typ
         self.sym = sym
         self.tc = tc
-        self.target = None
+        self.targets = targets
 
-    def add_target(self, t: Target):
-        last = None
-        p = self.target
-
-        while p is not None and t.state.nr >= p.state.nr:
-            if t.state == p.state:
-                return
-            last, p = p, p.next
-
-        t.next = p
-        if p == self.target:
-            self.target = t
-        else:
-            last.next = t
+    def add_target(self, state: 'State'):
+        if state not in self.targets:
+            self.targets = tuple(sorted(self.targets + (state,), key=lambda s: s.nr))
 
     def add_targets(self, a: 'Action'):
-        p = a.target
-        while p is not None:
-            self.add_target(Target(p.state))
-            p = p.next
+        if a.targets != self.targets:
+            self.targets = tuple(sorted(set(self.targets).union(a.targets), key=lambda s: s.nr))
 
         if a.tc == Node.contextTrans:
             self.tc = Node.contextTrans
@@ -81,14 +66,31 @@ class Action:
             c = tab.find_CharClass(s)
             if c is None:
                 c = tab.new_CharClass('#', s)
-                self.typ = Node.clas
-                self.sym = c.n
+            self.typ = Node.clas
+            self.sym = c.n
 
-    def targets_iterator(self) -> Generator[Target]:
-        target = self.target
-        while target is not None:
-            yield target
-            target = target.next
+
+class ActionIndex:
+    """ Finds the action of a state for a char: single char actions by a dict, class
+    actions by bisection over disjoint intervals. Like DFA.find_action() it returns the
+    first matching action of State.actions, where class actions come before char actions
+    """
+    chars: Dict[int, Action]
+    starts: List[int]
+    ends: List[int]
+    actions: List[Action]  # class action for the interval starts[i]..ends[i]
+
+    def __init__(self, chars: Dict[int, Action], starts: List[int], ends: List[int], actions: List[Action]):
+        self.chars = chars
+        self.starts = starts
+        self.ends = ends
+        self.actions = actions
+
+    def find(self, ch: int) -> Optional[Action]:
+        i = bisect_right(self.starts, ch) - 1
+        if i >= 0 and ch <= self.ends[i]:
+            return self.actions[i]
+        return self.chars.get(ch)
 
 
 class State:
@@ -97,30 +99,36 @@ class State:
     endOf: Symbol
     ctx: bool
     next: 'State'
+    index: Optional[ActionIndex]  # built by DFA.find_action(), None if actions changed since
 
     def __init__(self):
         self.ctx = False
         self.actions = []
+        self.endOf = None
+        self.next = None
+        self.index = None
 
     def add_action(self, act: Action):
-        i = 0
-        for i, action in enumerate(self.actions):
+        # collecting classes at the beginning gives better performance
+        i = len(self.actions)
+        for j, action in enumerate(self.actions):
             if act.typ < action.typ:
+                i = j
                 break
         self.actions.insert(i, act)
+        self.index = None
 
     def detach_action(self, act: Action):
         try:
             i = self.actions.index(act)
             self.actions.pop(i)
+            self.index = None
         except ValueError:
             pass
 
     def melt_with(self, s: 'State'):
         for action in s.actions:
-            a = Action(action.typ, action.sym, action.tc)
-            a.add_targets(action)
-            self.add_action(a)
+            self.add_action(Action(action.typ, action.sym, action.tc, action.targets))
 
     @property
     def first_action(self) -> Action:
@@ -128,7 +136,10 @@ class State:
 
 
 class Melted:
-    def __init__(self, set_: set, state: State):
+    set_: FrozenSet[int]  # numbers of the (non melted) states melted into state
+    state: State
+
+    def __init__(self, set_: FrozenSet[int], state: State):
         self.set_ = set_
         self.state = state
 
@@ -146,13 +157,14 @@ class DFA:
     gen: TextIO             # generated scanner file  /* pdt */
     curSy: Symbol           # current token to be recognized (in FindTrans)
     dirty_DFA: bool         # DFA may become nondeterministic in MatchLiteral
+    state_profile: Optional[Dict[int, int]] = None  # visits per state number: hot states are dispatched first
 
     tab: Tab                # other Coco objects
-    parser: Parser
+    parser: 'Parser'
     errors: Errors
     trace: Trace
 
-    def DFA(self, parser: Parser):
+    def DFA(self, parser: 'Parser'):
         self.parser = parser
         self.tab = parser.tab
         self.errors = parser.errors
@@ -161,7 +173,8 @@ class DFA:
         self._last_state = None
         self.last_state_nr = -1
         self._first_state = self.new_state()
-        self.first_melted = None
+        self.melted = {}
+        self.melted_by_nr = {}
         self.first_comment = None
         self.ignore_case = False
         self.dirty_DFA = False
@@ -176,6 +189,10 @@ class DFA:
     def ch_cond(ch: int) -> str:
         return "ch == {}".format(ch)
 
+    @staticmethod
+    def self_ch_cond(ch: int) -> str:
+        return "self.ch == {}".format(ch)  # for the commentN() methods, which have no ch local
+
     def put_range(self, s: CharSet):
         for i, r in enumerate(s.ranges):
             if r.from_ == r.to:
@@ -186,7 +203,61 @@ class DFA:
                 self.gen.write("ch >= {} and ch <= {}".format(r.from_, r.to))
 
             if i != len(s.ranges) - 1:
-                self.gen.write(" || ")
+                self.gen.write(" or ")
+
+    @staticmethod
+    def byte_class(s: CharSet) -> Optional[str]:
+        """ Regex character class (bytes pattern) of the ASCII part of s, None if empty
+        """
+        items = []
+        for r in s.ranges:
+            if r.from_ > 127:
+                break
+            to = min(r.to, 127)
+            if r.from_ == to:
+                items.append('\\x{:02x}'.format(r.from_))
+            else:
+                items.append('\\x{:02x}-\\x{:02x}'.format(r.from_, to))
+
+        return '[{}]'.format(''.join(items)) if items else None
+
+    def gen_ignored_re(self):
+        cls = self.byte_class(self.tab.ignored)
+        if cls is None:
+            self.println('\tignoredRe = None')
+        elif self.ignore_case:
+            self.println("\tignoredRe = re.compile(rb'{}+', re.IGNORECASE)".format(cls))
+        else:
+            self.println("\tignoredRe = re.compile(rb'{}+')".format(cls))
+
+    def run_class(self, state: State) -> Optional[str]:
+        """ Regex character class (bytes pattern) of the ASCII chars that loop in state,
+        for Scanner.add_run(). Line breaks are left to next_ch(); with ignore_case only the
+        lower case letters are kept, the pattern is compiled with re.IGNORECASE.
+        None if there are no such chars or state counts an appendix (context state)
+        """
+        if state.ctx:
+            return None
+
+        s = CharSet()
+        for action in state.actions:
+            if action.targets[0] is state and action.tc == Node.normalTrans:
+                for r in action.symbols(self.tab).ranges:
+                    for ch in range(r.from_, min(r.to, 127) + 1):
+                        if ch not in (10, 13) and not (self.ignore_case and chr(ch).isupper()):
+                            s.set(ch)
+
+        return self.byte_class(s)
+
+    def gen_run_res(self):
+        for state in self.states():
+            cls = self.run_class(state)
+            if cls is None:
+                continue
+            if self.ignore_case:
+                self.println("\t_run{} = re.compile(rb'{}+', re.IGNORECASE)".format(state.nr, cls))
+            else:
+                self.println("\t_run{} = re.compile(rb'{}+')".format(state.nr, cls))
 
     # ---------- State handling
 
@@ -203,39 +274,43 @@ class DFA:
         return s
 
     def new_transition(self, from_: State, to: State, typ: int, sym: int, tc: int):
-        t = Target(to)
-        a = Action(typ=typ, sym=sym, tc=tc)
-        a.target = t
+        a = Action(typ=typ, sym=sym, tc=tc, targets=(to,))
         from_.add_action(a)
 
         if typ == Node.clas:
             self.curSy.tokenKind = Symbol.classToken
 
     def combine_shifts(self):
-        state: State = self._first_state
+        """ Merges the actions of each state that lead to the same target state with the same
+        transition code into one action, grouping them in one pass over the actions
+        """
+        for state in self.states():
+            groups: Dict[Tuple[State, int], List[Action]] = {}
+            for a in state.actions:
+                groups.setdefault((a.targets[0], a.tc), []).append(a)
 
-        while state is not None:
-            to_detach = []
-            for i, a in enumerate(state.actions):
-                for b in state.actions[i + 1:]:
-                    if a.target[0].state == b.target[0].state and a.tc == b.tc:
-                        seta = a.symbols(self.tab)
-                        setb = b.symbols(self.tab)
-                        seta.or_(setb)
-                        a.shift_with(seta, self.tab)
-                        to_detach.append(b)
-
-            for action in to_detach:
-                state.detach_action(action)
+            if len(groups) == len(state.actions):
+                continue
 
-            state = state.next
+            actions = []
+            for a in state.actions:
+                group = groups[(a.targets[0], a.tc)]
+                if group[0] is a:
+                    if len(group) > 1:
+                        a.shift_with(CharSet.union(b.symbols(self.tab) for b in group), self.tab)
+                    actions.append(a)
+
+            state.actions = actions
+            state.index = None
 
     def find_used_states(self, state: State, used: Set[int]):
-        if state.nr in used:
-            return
-        used.add(state.nr)
-        for a in state.actions:
-            self.find_used_states(a.target.state, used)
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            if state.nr in used:
+                continue
+            used.add(state.nr)
+            stack.extend(a.targets[0] for a in reversed(state.actions))
 
     def delete_redundant_states(self):
         new_state: List[Optional[State]] = [None] * (self.last_state_nr + 1)
@@ -259,8 +334,8 @@ class DFA:
         for state in self.states():
             if state.nr in used:
                 for a in state.actions:
-                    if a.target.state.nr not in used:
-                        a.target.state = new_state[a.target.state.nr]
+                    if a.targets[0].nr not in used:
+                        a.targets = (new_state[a.targets[0].nr],)
 
         # delete unused states
         self._last_state = self._first_state
@@ -282,29 +357,36 @@ class DFA:
 
         return p.state
 
-    def step(self, from_:State, p: Node, stepped: Set[int]):
-        if p is None:
-            return
-
-        stepped.add(p.n)
-        if p.typ in (Node.clas, Node.chr):
-            self.new_transition(from_, self.the_state(p.next), p.typ, p.val, p.code)
-        elif p.typ == Node.alt:
-            self.step(from_, p.sub, stepped)
-            self.step(from_, p.down, stepped)
-        elif p.typ == Node.iter:
-            if self.tab.del_sub_graph(p.sub):
-                self.parser.sem_err("contents of {...} must not be deletable")
-                return
-            if p.next is not None and p.next.n not in stepped:
-                self.step(from_, p.next, stepped)
-            self.step(from_, p.sub, stepped)
-            if p.state != from_:
-                self.step(p.state, p, set())
-        elif p.typ == Node.opt:
-            if p.next is not None and p.next.n not in stepped:
-                self.step(from_, p.next, stepped)
-            self.step(from_, p.sub, stepped)
+    def step(self, from_: State, p: Node, stepped: Set[int]):
+        # pending calls (from_, p, stepped), the next one on top
+        stack: List[Tuple[State, Optional[Node], Set[int]]] = [(from_, p, stepped)]
+        while stack:
+            from_, p, stepped = stack.pop()
+            if p is None:
+                continue
+
+            stepped.add(p.n)
+            calls: List[Tuple[State, Optional[Node], Set[int]]] = []
+            if p.typ in (Node.clas, Node.chr):
+                self.new_transition(from_, self.the_state(p.next), p.typ, p.val, p.code)
+            elif p.typ == Node.alt:
+                calls.append((from_, p.sub, stepped))
+                calls.append((from_, p.down, stepped))
+            elif p.typ == Node.iter:
+                if self.tab.del_sub_graph(p.sub):
+                    self.parser.sem_err("contents of {...} must not be deletable")
+                    continue
+                if p.next is not None and p.next.n not in stepped:
+                    calls.append((from_, p.next, stepped))
+                calls.append((from_, p.sub, stepped))
+                if p.state != from_:
+                    calls.append((p.state, p, set()))
+            elif p.typ == Node.opt:
+                if p.next is not None and p.next.n not in stepped:
+                    calls.append((from_, p.next, stepped))
+                calls.append((from_, p.sub, stepped))
+
+            stack.extend(reversed(calls))
 
     # Assigns a state n.state to every node n. There will be a transition from
     # n.state to n.next.state triggered by n.val. All nodes in an alternative
@@ -314,49 +396,57 @@ class DFA:
     #  - if a nested structure starts with an iteration the iter node must get a new number
     #  - if an iteration follows an iteration, it must get a new number
     def number_nodes(self, p: Node, state: Optional[State], renum_iter: bool):
-        if p is None:
-            return
-        if p.state is not None:  # already visited
-            return
-        if state is None or p.typ == Node.iter and renum_iter:
-            state = self.new_state()
-        p.state = state
-
-        if self.tab.del_graph(p):
-            state.endOf = self.curSy
-
-        if p.typ in (Node.clas, Node.chr):
-            self.number_nodes(p.next, None, False)
-        elif p.typ == Node.opt:
-            self.number_nodes(p.next, None, False)
-            self.number_nodes(p.sub, state, True)
-        elif p.typ == Node.iter:
-            self.number_nodes(p.next, state, True)
-            self.number_nodes(p.sub, state, True)
-        elif p.typ == Node.alt:
-            self.number_nodes(p.next, None, False)
-            self.number_nodes(p.sub, state, True)
-            self.number_nodes(p.down, state, renum_iter)
+        # pending calls (p, state, renum_iter), the next one on top
+        stack: List[Tuple[Optional[Node], Optional[State], bool]] = [(p, state, renum_iter)]
+        while stack:
+            p, state, renum_iter = stack.pop()
+            if p is None:
+                continue
+            if p.state is not None:  # already visited
+                continue
+            if state is None or p.typ == Node.iter and renum_iter:
+                state = self.new_state()
+            p.state = state
+
+            if self.tab.del_graph(p):
+                state.endOf = self.curSy
+
+            if p.typ in (Node.clas, Node.chr):
+                stack.append((p.next, None, False))
+            elif p.typ == Node.opt:
+                stack.append((p.sub, state, True))
+                stack.append((p.next, None, False))
+            elif p.typ == Node.iter:
+                stack.append((p.sub, state, True))
+                stack.append((p.next, state, True))
+            elif p.typ == Node.alt:
+                stack.append((p.down, state, renum_iter))
+                stack.append((p.sub, state, True))
+                stack.append((p.next, None, False))
 
     def find_trans(self, p: Node, start: bool, marked: Set[int]):
-        if p is None or p.n in marked:
-            return
-        marked.add(p.n)
-
-        if start:
-            self.step(p.state, p, set())
-
-        if p.typ in (Node.clas, Node.chr):
-            self.find_trans(p.next, True, marked)
-        elif p.typ == Node.opt:
-            self.find_trans(p.next, True, marked)
-            self.find_trans(p.sub, False, marked)
-        elif p.typ == Node.iter:
-            self.find_trans(p.next, False, marked)
-            self.find_trans(p.sub, False, marked)
-        elif p.typ == Node.alt:
-            self.find_trans(p.sub, False, marked)
-            self.find_trans(p.down, False, marked)
+        # pending calls (p, start), the next one on top
+        stack: List[Tuple[Optional[Node], bool]] = [(p, start)]
+        while stack:
+            p, start = stack.pop()
+            if p is None or p.n in marked:
+                continue
+            marked.add(p.n)
+
+            if start:
+                self.step(p.state, p, set())
+
+            if p.typ in (Node.clas, Node.chr):
+                stack.append((p.next, True))
+            elif p.typ == Node.opt:
+                stack.append((p.sub, False))
+                stack.append((p.next, True))
+            elif p.typ == Node.iter:
+                stack.append((p.sub, False))
+                stack.append((p.next, False))
+            elif p.typ == Node.alt:
+                stack.append((p.down, False))
+                stack.append((p.sub, False))
 
     def convert_to_states(self, p: Node, sym: Symbol):
         self.curSy = sym
@@ -382,7 +472,7 @@ class DFA:
             a = self.find_action(state, ord(s[i]))
             if a is None:
                 break
-            state = a.target.state
+            state = a.targets[0]
             i += 1
 
         # if s was not totally consumed or leads to a non-final state => make new DFA from it
@@ -407,69 +497,53 @@ class DFA:
             matched_sym.tokenKind = Symbol.classLitToken
             sym.tokenKind = Symbol.litToken
 
-    def states(self) -> Generator[State]:
+    def states(self) -> Iterator[State]:
         state = self._first_state
         while state is not None:
             yield state
             state = state.next
 
-    def split_actions(self, state: State, a: Action, b: Action):
-        seta = a.symbols(self.tab)
-        setb = b.symbols(self.tab)
-        if seta.equals(setb):
-            a.add_targets(b)
-            state.detach_action(b)
-        elif seta.includes(setb):
-            setc = seta.clone()
-            setc.subtract(setb)
-            b.add_targets(a)
-            a.shift_with(setc, self.tab)
-        elif setb.includes(seta):
-            setc = setb.clone()
-            setc.subtract(seta)
-            a.add_targets(b)
-            b.shift_with(setc, self.tab)
-        else:
-            setc = seta.clone()
-            setc.and_(setb)
-            seta.subtract(setc)
-            setb.subtract(setc)
-            a.shift_with(seta, self.tab)
-            b.shift_with(setb, self.tab)
-            c = Action(0, 0, Node.normalTrans)  # typ and sym are set in ShiftWith
-            c.add_targets(a)
-            c.add_targets(b)
-            c.shift_with(setc, self.tab)
-            state.add_action(c)
-
-    def overlap(self, a: Action, b: Action) -> bool:
-        if a.typ == Node.chr:
-            if b.typ == Node.chr:
-                return a.sym == b.sym
-            setb = self.tab.CharClass_set(b.sym)
-            return setb.get(a.sym)
-        seta = self.tab.CharClass_set(a.sym)
-        if b.typ == Node.chr:
-            return seta.get(b.sym)
-        setb = self.tab.CharClass_set(b.sym)
-        return seta.intersects(setb)
-
     def make_unique(self, state: State):
-        changed = True
-        while changed:
-            changed = False
-            for i, a in enumerate(state.actions):
-                for b in state.actions[i + 1:]:
-                    if self.overlap(a, b):
-                        self.split_actions(state, a, b)
-                        changed = True
+        """ Makes the actions of state deterministic. The chars of all actions are split into
+        disjoint intervals by a sweep over their range bounds (see partition()); every interval
+        gets the union of the targets of the actions covering it, and the intervals with equal
+        targets are shifted to one action
+        """
+        ranges: List[Tuple[int, int, int]] = []
+        for i, a in enumerate(state.actions):
+            if a.typ == Node.chr:
+                ranges.append((a.sym, a.sym, i))
+            else:
+                ranges.extend((r.from_, r.to, i) for r in self.tab.CharClass_set(a.sym).ranges)
+
+        intervals = self.partition(ranges)
+        if all(len(covering) == 1 for _, _, covering in intervals):
+            return  # no overlaps
+
+        groups: Dict[Tuple[Tuple[State, ...], int], CharSet] = {}
+        for from_, to, covering in intervals:
+            u = Action(0, 0, Node.normalTrans)
+            for i in sorted(covering):
+                u.add_targets(state.actions[i])
+
+            s = groups.setdefault((u.targets, u.tc), CharSet())
+            if s.ranges and s.ranges[-1].to + 1 == from_:
+                s.ranges[-1].to = to
+            else:
+                s.ranges.append(Range(from_, to))
+
+        state.actions = []
+        for (targets, tc), s in groups.items():
+            a = Action(0, 0, tc, targets)  # typ and sym are set in shift_with
+            a.shift_with(s, self.tab)
+            state.add_action(a)
 
     def melt_states(self, state: State):
         for action in state.actions:
-            if action.target.next is None:
+            if len(action.targets) > 1:
                 param: List[Any] = [None] * 2
                 ctx = self.get_target_states(action, param)
-                targets: Optional[Set[int]] = param[0]
+                targets: FrozenSet[int] = param[0]
                 end_of: Optional[Symbol] = param[1]
 
                 melt: Optional[Melted] = self.state_with_set(targets)
@@ -478,24 +552,22 @@ class DFA:
                     s.endOf = end_of
                     s.ctx = ctx
 
-                    for targ in action.targets_iterator():
-                        s.melt_with(targ.state)
+                    for targ in action.targets:
+                        s.melt_with(targ)
 
                     self.make_unique(s)
                     melt = self.new_melted(targets, s)
 
-                action.target.next = None
-                action.target.state = melt.state
+                action.targets = (melt.state,)
 
     def find_ctx_states(self):
         for state in self.states():
             for a in state.actions:
                 if a.tc == Node.contextTrans:
-                    a.target.state.ctx = True
+                    a.targets[0].ctx = True
 
     def make_deterministic(self):
-        last_sim_state = self._last_state.nr
-        max_states = 2 * last_sim_state  # heuristic for set size in Melted.set
+        self.last_sim_state = self._last_state.nr
         self.find_ctx_states()
 
         for state in self.states():
@@ -533,8 +605,8 @@ class DFA:
                 else:
                     self.trace.write(self.ch(action.sym), 3)
 
-                for targ in action.targets_iterator():
-                    self.trace.write(str(targ.state.nr), 3)
+                for targ in action.targets:
+                    self.trace.write(str(targ.nr), 3)
 
                 if action.tc == Node.contextTrans:
                     self.trace.write_line(" context")
@@ -547,15 +619,62 @@ class DFA:
 
     # ------------------------ actions ------------------------------
     def find_action(self, state: State, ch: int) -> Optional[Action]:
-        for a in state.actions:
-            if a.typ == Node.chr and ch == a.sym:
-                return a
-            if a.typ == Node.clas:
-                s = self.tab.CharClass_set(a.sym)
-                if s.get(ch):
-                    return a
+        if state.index is None:
+            state.index = self.action_index(state)
+        return state.index.find(ch)
+
+    def action_index(self, state: State) -> ActionIndex:
+        chars: Dict[int, Action] = {}
+        ranges: List[Tuple[int, int, int]] = []
+        for i, a in enumerate(state.actions):
+            if a.typ == Node.chr:
+                chars.setdefault(a.sym, a)
+            else:
+                ranges.extend((r.from_, r.to, i) for r in self.tab.CharClass_set(a.sym).ranges)
 
-        return None
+        starts: List[int] = []
+        ends: List[int] = []
+        actions: List[Action] = []
+        for from_, to, covering in self.partition(ranges):
+            starts.append(from_)
+            ends.append(to)
+            actions.append(state.actions[min(covering)])
+
+        return ActionIndex(chars, starts, ends, actions)
+
+    @staticmethod
+    def partition(ranges: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, int, Set[int]]]:
+        """ Splits the chars covered by the (from, to, id) ranges into disjoint intervals
+        (from, to, ids of the ranges covering the interval) by a sweep over the range bounds
+        """
+        result: List[Tuple[int, int, Set[int]]] = []
+        bounds = sorted(ranges)
+        ends: List[Tuple[int, int]] = []  # heap of (to + 1, id) of the active ranges
+        active: Dict[int, int] = {}       # ids of the active ranges -> number of their active ranges
+        i = 0
+        pos = bounds[0][0] if bounds else 0
+        while i < len(bounds) or ends:
+            # next point where the set of active ranges changes
+            if i < len(bounds) and (not ends or bounds[i][0] < ends[0][0]):
+                nxt = bounds[i][0]
+            else:
+                nxt = ends[0][0]
+            if active and pos < nxt:
+                result.append((pos, nxt - 1, set(active)))
+            pos = nxt
+
+            while ends and ends[0][0] == pos:
+                _, id_ = heappop(ends)
+                active[id_] -= 1
+                if active[id_] == 0:
+                    del active[id_]
+            while i < len(bounds) and bounds[i][0] == pos:
+                from_, to, id_ = bounds[i]
+                heappush(ends, (to + 1, id_))
+                active[id_] = active.get(id_, 0) + 1
+                i += 1
+
+        return result
 
     def get_target_states(self, a: Action, param: List[Any]) -> bool:
         """ Compute the set of target states
@@ -564,55 +683,46 @@ class DFA:
         targets: Set[int] = set()
         end_of: Optional[Symbol] = None
 
-        for t in a.targets_iterator():
-            state_nr = t.state.nr
-            if state_nr < self.last_sim_state:
+        for t in a.targets:
+            state_nr = t.nr
+            if state_nr <= self.last_sim_state:
                 targets.add(state_nr)
             else:
                 targets.update(self.melted_set(state_nr))
 
-            if t.state.endOf is not None:
-                if end_of is None or end_of == t.state.endOf:
-                    end_of = t.state.endOf
+            if t.endOf is not None:
+                if end_of is None or end_of == t.endOf:
+                    end_of = t.endOf
                 else:
                     self.errors.sem_err("Tokens {} and {} "
-                                        "cannot be distinguished".format(end_of.name, t.state.endOf.name))
-            if t.state.ctx:
+                                        "cannot be distinguished".format(end_of.name, t.endOf.name))
+            if t.ctx:
                 ctx = True
 
-        param[0] = targets
+        param[0] = frozenset(targets)
         param[1] = end_of
         return ctx
 
     # ---------------------- melted states --------------------------
 
-    first_melted: Optional[Melted] = None  # head of melted state list
-
-    def melted_iterator(self) -> Generator[Melted]:
-        m = self.first_melted
-        while m is not None:
-            yield m
-            m = m.next
+    melted: Dict[FrozenSet[int], Melted]  # melted states by the set of states melted into them
+    melted_by_nr: Dict[int, Melted]        # melted states by state number
 
-    def new_melted(self, set_: Set[int], state: State) -> Melted:
+    def new_melted(self, set_: FrozenSet[int], state: State) -> Melted:
         m = Melted(set_, state)
-        m.next = self.first_melted
-        self.first_melted = m
+        self.melted[set_] = m
+        self.melted_by_nr[state.nr] = m
         return m
 
-    def melted_set(self, nr: int) -> Set[int]:
-        for m in self.melted_iterator():
-            if m.state.nr == nr:
-                return m.set_
+    def melted_set(self, nr: int) -> FrozenSet[int]:
+        m = self.melted_by_nr.get(nr)
+        if m is None:
+            raise FatalError("Compiler error in Melted.Set")
 
-        raise FatalError("Compiler error in Melted.Set")
+        return m.set_
 
-    def state_with_set(self, s: Set[int]) -> Optional[Melted]:
-        for m in self.melted_iterator():
-            if s == m.set_:
-                return m
-
-        return None
+    def state_with_set(self, s: FrozenSet[int]) -> Optional[Melted]:
+        return self.melted.get(s)
 
     # ------------------------- comments ----------------------------
     first_comment: Optional[Comment] = None
@@ -645,66 +755,72 @@ class DFA:
     def println(self, s: str = ''):
         self.print(s + '\n')
 
-    def gen_com_body(self, com: Comment):
-        self.println("\t\t\twhile True:")
-        self.println('\t\t\t\tif {}:'.format(self.ch_cond(ord(com.stop[0]))))
+    def fast_comment_args(self, com: Comment) -> Optional[str]:
+        """ Arguments of the Scanner.skip_comment() call for com, None if there is no fast path
+        """
+        args = fast_comment_args(com.start, com.stop, com.nested, self.ignore_case)
+        if args is None:
+            return None
+        return '{}, {}, {}'.format(*args)
+
+    def gen_com_body(self, com: Comment, indent: str):
+        args = self.fast_comment_args(com)
+        if args is not None:
+            self.println(indent + 'if self.skip_comment({}, line0):'.format(args))
+            self.println(indent + '\treturn True')
+        self.println(indent + 'while True:')
+        self.println(indent + '\tif {}:'.format(self.self_ch_cond(ord(com.stop[0]))))
 
         if len(com.stop) == 1:
-            self.println('\t\t\t\t\tlevel -= 1')
-            self.println('\t\t\t\t\tif level == 0:')
-            self.println('\t\t\t\t\t\tself.old_eols = self.line - line0')
-            self.println('\t\t\t\t\t\tself.next_ch()')
-            self.println('\t\t\t\t\t\treturn True')
-            self.println('\t\t\t\t\tself.next_ch()')
+            self.println(indent + '\t\tlevel -= 1')
+            self.println(indent + '\t\tif level == 0:')
+            self.println(indent + '\t\t\tself.old_eols = self.line - line0')
+            self.println(indent + '\t\t\tself.next_ch()')
+            self.println(indent + '\t\t\treturn True')
+            self.println(indent + '\t\tself.next_ch()')
         else:
-            self.println('\t\t\t\t\tself.next_ch()')
-            self.println('\t\t\t\t\tif {}:'.format(self.ch_cond(ord(com.stop[1]))))
-            self.println('\t\t\t\t\t\tlevel -= 1')
-            self.println('\t\t\t\t\t\tif level == 0:')
-            self.println('\t\t\t\t\t\t\tself.old_eols = self.line - line0')
-            self.println('\t\t\t\t\t\t\tself.next_ch()')
-            self.println('\t\t\t\t\t\t\treturn True')
-            self.println('\t\t\t\t\t\tself.next_ch()')
+            self.println(indent + '\t\tself.next_ch()')
+            self.println(indent + '\t\tif {}:'.format(self.self_ch_cond(ord(com.stop[1]))))
+            self.println(indent + '\t\t\tlevel -= 1')
+            self.println(indent + '\t\t\tif level == 0:')
+            self.println(indent + '\t\t\t\tself.old_eols = self.line - line0')
+            self.println(indent + '\t\t\t\tself.next_ch()')
+            self.println(indent + '\t\t\t\treturn True')
+            self.println(indent + '\t\t\tself.next_ch()')
 
         if com.nested:
-            self.println('\t\t\t\telif {}:'.format(self.ch_cond(ord(com.start[0]))))
+            self.println(indent + '\telif {}:'.format(self.self_ch_cond(ord(com.start[0]))))
             if len(com.start) == 1:
-                self.println('\t\t\t\t\tlevel += 1')
-                self.println('\t\t\t\t\tself.next_ch()')
+                self.println(indent + '\t\tlevel += 1')
+                self.println(indent + '\t\tself.next_ch()')
             else:
-                self.println('\t\t\t\t\tself.next_ch()')
-                self.println('\t\t\t\t\tif {}:'.format(self.ch_cond(ord(com.start[1]))))
-                self.println('\t\t\t\t\t\tlevel += 1')
-                self.println('\t\t\t\t\t\tself.next_ch()')
+                self.println(indent + '\t\tself.next_ch()')
+                self.println(indent + '\t\tif {}:'.format(self.self_ch_cond(ord(com.start[1]))))
+                self.println(indent + '\t\t\tlevel += 1')
+                self.println(indent + '\t\t\tself.next_ch()')
 
-        self.println('\t\t\t\telif self.ch == Buffer.EOF:')
-        self.println('\t\t\t\t\treturn False')
-        self.println('\t\t\t\telse:')
-        self.println('\t\t\t\t\tself.next_ch()')
+        self.println(indent + '\telif self.ch == Buffer.EOF:')
+        self.println(indent + '\t\treturn False')
+        self.println(indent + '\telse:')
+        self.println(indent + '\t\tself.next_ch()')
 
     def gen_comment(self, com: Comment, i: int):
         self.println()
         self.println('\tdef comment{}(self) -> bool:'.format(i))
         self.println('\t\tlevel:int = 1')
-        self.println('\t\tpos0 = self.pos')
+        self.println('\t\tstate0 = self.save()')
         self.println('\t\tline0 = self.line')
-        self.println('\t\tcol0 = self.col')
-        self.println('\t\tchar_pos0 = self.char_pos')
 
         if len(com.start) == 1:
             self.println('\t\tself.next_ch()')
-            self.gen_com_body(com)
+            self.gen_com_body(com, '\t\t')
         else:
             self.println('\t\tself.next_ch()')
-            self.println('\t\tif {}:'.format(self.ch_cond(ord(com.start[1]))))
+            self.println('\t\tif {}:'.format(self.self_ch_cond(ord(com.start[1]))))
             self.println('\t\t\tself.next_ch()')
-            self.gen_com_body(com)
+            self.gen_com_body(com, '\t\t\t')
             self.println('\t\telse:')
-            self.println('\t\t\tself.set_pos(pos0)')
-            self.println('\t\t\tself.next_ch()')
-            self.println('\t\t\tself.line = line0')
-            self.println('\t\t\tself.col = col0')
-            self.println('\t\t\tself.char_pos = char_pos0')
+            self.println('\t\t\tself.restore(state0)')
             self.println('\t\treturn False')
 
         self.println()
@@ -717,29 +833,54 @@ class DFA:
 
         return sym.name
 
+    def literal_table(self) -> Dict[int, Dict[str, int]]:
+        """ Kinds of the literal tokens by their (case folded) strings, bucketed by string length
+        """
+        buckets: Dict[int, Dict[str, int]] = {}
+        for sym in self.tab.terminals + self.tab.pragmas:
+            if sym.tokenKind == Symbol.litToken:
+                name = self.tab.unescape(self.sym_name(sym)[1:-1])
+                if self.ignore_case:
+                    name = name.lower()
+                buckets.setdefault(len(name), {})[name] = sym.n
+
+        return buckets
+
     def gen_literals(self):
-        ts = [self.tab.terminals, self.tab.pragmas]
-        for iter_ in ts:
-            for sym in iter_:
-                if sym.tokenKind == Symbol.litToken:
-                    name = self.sym_name(sym)
-                    if self.ignore_case:
-                        name = name.lower()
-                    self.println('\t\tself.literals[{}] = {}'.format(name, sym.n))
-
-    def write_state(self, state: State):
+        """ Writes the literal table as a class constant, bucketed by string length
+        so that identifiers of other lengths need no hashing or case folding
+        """
+        buckets = self.literal_table()
+        self.println('\tliterals: Dict[int, Dict[str, int]] = {')
+        for length in sorted(buckets):
+            self.println('\t\t{}: {!r},'.format(length, buckets[length]))
+        self.println('\t}')
+
+    def write_state(self, state: State, indent: str = '\t\t\t\t', test: Optional[str] = 'elif'):
+        """ Writes the code of state as a branch '<test> state == <nr>:' of the state
+        dispatch in next_token(), or only the body of the branch if test is None
+        """
         endOf: Symbol = state.endOf
-        self.println('\t\t\t\tif state == {}:'.format(state.nr, 1))
+        if test is not None:
+            self.println('{}{} state == {}:'.format(indent, test, state.nr))
+            indent += '\t'
+
+        if self.tab.scannerRuns and self.run_class(state) is not None:
+            self.println(indent + 'if self.add_run(self._run{}):'.format(state.nr))
+            self.println(indent + '\tch = self.ch')
         if endOf is not None and state.first_action is not None:
-            self.println('\t\t\t\t\trec_end = pos')
-            self.println('\t\t\t\t\trec_kind = {}'.format(endOf.n))
+            # a snapshot is only needed if the scanner can get stuck behind this state
+            if any(action.targets[0].endOf is None for action in state.actions):
+                self.println(indent + 'rec_end = self.save()')
+                self.println(indent + 'rec_len = len(self.tval)')
+            self.println(indent + 'rec_kind = {}'.format(endOf.n))
 
         ctx_end: bool = state.ctx
         for action in state.actions:
             if action == state.first_action:
-                self.print('\t\t\t\t\tif ')
+                self.print(indent + 'if ')
             else:
-                self.print('\t\t\t\t\telif ')
+                self.print(indent + 'elif ')
 
             if action.typ == Node.chr:
                 self.print(self.ch_cond(action.sym))
@@ -748,45 +889,100 @@ class DFA:
 
             self.println(':')
             if action.tc == Node.contextTrans:
-                self.println('\t\t\t\t\t\tapx += 1')
+                # the first char of the appendix: remember the position behind the token
+                self.println(indent + '\tif apx == 0:')
+                self.println(indent + '\t\tctx_end = self.save()')
+                self.println(indent + '\t\tctx_len = len(self.tval)')
+                self.println(indent + '\tapx += 1')
                 ctx_end = False
             elif state.ctx:
-                self.println('\t\t\t\t\t\tapx = 0')
+                self.println(indent + '\tapx = 0')
 
-            self.println('\t\t\t\t\t\tself.add_ch()')
-            self.println('\t\t\t\t\t\tstate = {}'.format(action.target.state.nr))
+            self.println(indent + '\tself.add_ch()')
+            self.println(indent + '\tstate = {}'.format(action.targets[0].nr))
 
-        if state.first_action is None:
-            self.println('\t\t\t\t\t:')
-        else:
-            self.println('\t\t\t\t\telse:')
+        if state.first_action is not None:
+            self.println(indent + 'else:')
+            indent += '\t'
 
-        if ctx_end:  # final context state: cut appendix
-            self.println('\t\t\t\t\t\tself.set_scanner_behind_T()')
+        if ctx_end:  # final context state: cut appendix by going back to the position saved in front of it
+            self.println(indent + 'if apx > 0:')
+            self.println(indent + '\tself.set_scanner_behind_T(ctx_end, ctx_len)')
 
         if endOf is None:
-            self.println('\t\t\t\t\t\tstate = 0')
+            self.println(indent + 'state = 0')
         else:
-            self.println('\t\t\t\t\t\tself.t.kind = {}'.format(endOf.n))
+            self.println(indent + 'self.t.kind = {}'.format(endOf.n))
             if endOf.tokenKind == Symbol.classLitToken:
-                self.println('\t\t\t\t\t\tself.t.val = self.tval')
-                self.println('\t\t\t\t\t\tself.check_literal()')
-                self.println('\t\t\t\t\t\treturn self.t')
+                self.println(indent + "self.t.val = ''.join(self.tval)")
+                self.println(indent + 'self.check_literal()')
+                self.println(indent + 'return self.t')
             else:
-                self.println('\t\t\t\t\t\tbreak')
+                self.println(indent + 'break')
+
+    def state_weight(self, state: State) -> int:
+        return self.state_profile.get(state.nr, 0) if self.state_profile else 0
+
+    def write_state_chain(self):
+        """ Writes the states as an elif chain, the most visited states of the profile first
+        """
+        for state in sorted(self.states(), key=lambda s: -self.state_weight(s)):  # stable: by number otherwise
+            self.write_state(state)
+
+    def write_state_tree(self, states: List[State], indent: str):
+        """ Selects the branch of a state by comparing the state number with split points,
+        so that a state is reached after about log2(len(states)) comparisons instead of a
+        walk down the chain. With a profile the split points divide the visits into halves,
+        but every subtree keeps at least a quarter of the states to bound the depth
+        """
+        if len(states) == 1:
+            self.write_state(states[0], indent, None)
+            return
+
+        weights = [self.state_weight(state) + 1 for state in states]
+        total = sum(weights)
+        lo, hi = max(1, len(states) // 4), max(1, len(states) - len(states) // 4)
+        split = lo
+        left = sum(weights[:lo])
+        best = abs(total - 2 * left)
+        for i in range(lo + 1, hi + 1):
+            left += weights[i - 1]
+            if abs(total - 2 * left) < best:
+                split, best = i, abs(total - 2 * left)
+
+        self.println('{}if state < {}:'.format(indent, states[split].nr))
+        self.write_state_tree(states[:split], indent + '\t')
+        self.println(indent + 'else:')
+        self.write_state_tree(states[split:], indent + '\t')
 
     def write_start_tab(self):
+        """ Writes the start table as class constants: an array indexed by the
+        characters < 256 and sorted (from, to, state) ranges for the rest
+        """
+        low: List[int] = [0] * 256
+        high: List[Tuple[int, int, int]] = []
         for action in self._first_state.actions:
-            target_state = action.target.state.nr
+            target_state = action.targets[0].nr
             if action.typ == Node.chr:
-                self.println('\t\tself.start[{}] = {}'.format(action.sym, target_state))
+                ranges = [(action.sym, action.sym)]
             else:
-                s: CharSet = self.tab.CharClass_set(action.sym)
-                for r in s.ranges:
-                    self.println('\t\tfor i in range({}, {}):'.format(r.from_, r.to + 1))
-                    self.println('\t\t\tself.start[i] = {}'.format(target_state))
-
-        self.println('\t\tself.start[Buffer.EOF] = -1')
+                ranges = [(r.from_, r.to) for r in self.tab.CharClass_set(action.sym).ranges]
+
+            for from_, to in ranges:
+                for i in range(from_, min(to, 255) + 1):
+                    low[i] = target_state
+                if to > 255:
+                    high.append((max(from_, 256), to, target_state))
+
+        self.println("\tstart: array = array('i', (")
+        for i in range(0, 256, 16):
+            self.println('\t\t' + ', '.join('{:3d}'.format(x) for x in low[i:i + 16]) + ',')
+        self.println('\t))')
+        self.println('\tstartRanges: Tuple[Tuple[int, int, int], ...] = (')
+        for r in sorted(high):
+            self.println('\t\t({}, {}, {}),'.format(*r))
+        self.println('\t\t(Buffer.EOF, Buffer.EOF, -1),')
+        self.println('\t)')
 
     def write_scanner(self):
         g: Generator_ = Generator_(self.tab)
@@ -802,12 +998,15 @@ class DFA:
         self.println('\tmaxT: int = {}'.format(len(self.tab.terminals) - 1))
         self.println('\tnoSym: int = {}'.format(self.tab.noSym.n))
 
+        self.gen_ignored_re()
+        if self.tab.scannerRuns:
+            self.gen_run_res()
+        self.write_start_tab()
+        self.gen_literals()
         if self.ignore_case:
-            self.print('\tvalCh: str  # Current input character (for token.val)')
+            self.println('\tvalCh: str  # Current input character (for token.val)')
 
         g.copy_frame_part('-->initialization')
-        self.write_start_tab()
-        self.gen_literals()
 
         g.copy_frame_part('-->casing')
         if self.ignore_case:
@@ -817,9 +1016,9 @@ class DFA:
 
         g.copy_frame_part('-->casing2')
         if self.ignore_case:
-            self.println('\t\t\tself.tval += self.valCh')
+            self.println('\t\t\tself.tval.append(self.valCh)')
         else:
-            self.println('\t\t\tself.tval += chr(self.ch)')
+            self.println('\t\t\tself.tval.append(chr(self.ch))')
 
         g.copy_frame_part('-->comments')
         com: Comment = self.first_comment
@@ -831,7 +1030,7 @@ class DFA:
 
         g.copy_frame_part('-->casing3')
         if self.ignore_case:
-            self.println('\t\tval = val.lower()')
+            self.println('\t\t\tval = val.lower()')
 
         g.copy_frame_part('-->scan1')
         self.print('\t\t\t')
@@ -861,10 +1060,99 @@ class DFA:
         if self.has_ctx_moves:
             self.println()
             self.println('\t\tapx: int = 0')  # pdt
+            self.println('\t\tctx_end = None  # position in front of the appendix of a context token')
+            self.println('\t\tctx_len = 0')
 
         g.copy_frame_part('-->scan3')
-        for state in self.states():
-            self.write_state(state)
+        if self.tab.scannerDispatch == 'tree':
+            self.println('\t\t\t\telse:')
+            self.write_state_tree(sorted(self.states(), key=lambda s: s.nr), '\t\t\t\t\t')
+        else:
+            self.write_state_chain()
 
         g.copy_frame_part(None)
         self.gen.close()
+
+        if self.tab.scannerTables:
+            self.write_tables(os.path.join(self.tab.outDir, 'Scanner.tables'))
+
+    # ---------- scanner tables ----------
+
+    def make_tables(self) -> ScannerTables:
+        """ Exports the DFA as tables for the generic TableScanner. Chars with the same
+        transitions in every state form a char class; they are found by partitioning the
+        chars of all actions (see partition()), every interval being identified by the set
+        of actions that cover it
+        """
+        if self.dirty_DFA:
+            self.make_deterministic()
+
+        t = ScannerTables()
+        t.maxT = len(self.tab.terminals) - 1
+        t.noSym = self.tab.noSym.n
+        t.ignore_case = self.ignore_case
+
+        states = list(self.states())
+        table_nr: Dict[State, int] = {state: i + 1 for i, state in enumerate(states)}  # 0 is the error state
+        t.start_state = table_nr[self._first_state]
+        t.n_states = len(states) + 1
+
+        actions: List[Tuple[State, Action]] = []
+        ranges: List[Tuple[int, int, int]] = []
+        for state in states:
+            for action in state.actions:
+                for r in action.symbols(self.tab).ranges:
+                    ranges.append((r.from_, r.to, len(actions)))
+                actions.append((state, action))
+
+        classes: Dict[FrozenSet[int], int] = {}
+        intervals: List[Tuple[int, int, int]] = []
+        for from_, to, ids in self.partition(ranges):
+            cls = classes.setdefault(frozenset(ids), len(classes) + 1)
+            if intervals and intervals[-1][1] + 1 == from_ and intervals[-1][2] == cls:
+                intervals[-1] = (intervals[-1][0], to, cls)
+            else:
+                intervals.append((from_, to, cls))
+
+        t.n_classes = len(classes) + 1
+        low = [0] * 256
+        for from_, to, cls in intervals:
+            for ch in range(from_, min(to, 255) + 1):
+                low[ch] = cls
+            if to >= 256:
+                t.high_ranges.append((max(from_, 256), to, cls))
+        t.low_classes = array('i', low)
+        t.high_starts = [r[0] for r in t.high_ranges]
+
+        trans = [0] * (t.n_states * t.n_classes)
+        for ids, cls in classes.items():
+            for id_ in ids:
+                state, action = actions[id_]
+                target = table_nr[action.targets[0]]
+                trans[table_nr[state] * t.n_classes + cls] = -target if action.tc == Node.contextTrans else target
+        t.trans = array('i', trans)
+
+        accept = [-1] * t.n_states
+        flags = [0] * t.n_states
+        for state in states:
+            nr = table_nr[state]
+            if state.endOf is not None:
+                accept[nr] = state.endOf.n
+                if state.endOf.tokenKind == Symbol.classLitToken:
+                    flags[nr] |= ScannerTables.CHECK_LITERAL
+            if state.ctx:
+                flags[nr] |= ScannerTables.CTX_STATE
+        t.accept = array('i', accept)
+        t.flags = array('i', flags)
+
+        t.ignored = [(r.from_, r.to) for r in self.tab.ignored.ranges]
+        t.literals = self.literal_table()
+        com: Comment = self.first_comment
+        while com is not None:
+            t.comments.append((com.start, com.stop, com.nested))
+            com = com.next
+
+        return t
+
+    def write_tables(self, path: str):
+        self.make_tables().write(path)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from mmap import mmap, ACCESS_READ
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from .buffer import LineIndex
+from .errors import FatalError
+from .scanner import Scanner, Token, TokenArray
+
+
+COLUMNS: Tuple[str, ...] = ('kind', 'pos', 'end', 'reach', 'charPos', 'line', 'col')  # TokenArray columns in this order
+
+# tokens of a chunk as TokenArray columns, the first token behind the chunk as
+# (kind, pos, end, reach, charPos, line, col), number of EOLs and number of chars in the chunk
+Chunk = Tuple[Tuple[array, ...], Tuple[int, ...], int, int]
+
+
+def chunk_starts(data: Union[bytes, mmap], chunk_size: int) -> List[int]:
+    """ Splits data into chunks of about chunk_size bytes that start at the beginning of a line
+    """
+    starts = [0]
+    size = len(data)
+    while starts[-1] + chunk_size < size:
+        eol = data.find(b'\n', starts[-1] + chunk_size)
+        if eol < 0 or eol + 1 >= size:
+            break
+        starts.append(eol + 1)
+
+    return starts
+
+
+def tokenize_chunk(scanner_cls: Type[Scanner], path: str, start: int, end: int, kwargs: Dict[str, Any]) -> Chunk:
+    """ Tokenizes the bytes start..end of a file as if a token started at start.
+    Lines and char positions are counted from the start of the chunk (line 1, char 0);
+    the EOLs and chars of the chunk are only counted if the scanner tracks lines
+    """
+    with open(path, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as data:
+        scanner = scanner_cls(data, **kwargs)  # handles the byte order mark at the start of the file
+        if start > 0:
+            scanner.reset_to(start, 1, 1, 0)
+
+        result = TokenArray(scanner.buffer)
+        while True:
+            t = scanner.next_token()
+            if t.pos >= end:
+                lookover = (t.kind, t.pos, scanner.pos, scanner.token_reach(), t.charPos, t.line, t.col)
+                break
+            result.append(t, scanner.pos, scanner.token_reach())
+
+        eols = chars = 0
+        if scanner.track_lines:
+            if start == 0 and data[:len(LineIndex.UTF8_BOM)] == LineIndex.UTF8_BOM:
+                start = len(LineIndex.UTF8_BOM)  # the byte order mark is no char of the text
+            chunk = data[start:end]
+            eols = chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+            chars = scanner.buffer.char_count(chunk)
+
+    return tuple(getattr(result, name) for name in COLUMNS), lookover, eols, chars
+
+
+def tokenize_parallel(scanner_cls: Type[Scanner], path: str, workers: Optional[int] = None,
+                      chunk_size: int = 1 << 22, **kwargs) -> TokenArray:
+    """ Tokenizes a file with a pool of worker processes, each of which scans one chunk of
+    the file. Chunks start at line starts; a chunk boundary inside a comment or string is
+    detected by comparing the first token behind a chunk with the first token of the next
+    one, and the tokens in between are scanned again. The result is the same TokenArray
+    as Scanner.tokenize_all(columnar=True) returns; kwargs are passed to the scanners
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = mmap(f.fileno(), 0, access=ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b''
+    except OSError:
+        raise FatalError("Could not open file {}".format(path))
+
+    scanner = scanner_cls(data, **kwargs)
+    starts = chunk_starts(data, chunk_size)
+    if len(starts) == 1:
+        return scanner.tokenize_columnar()
+
+    ends = starts[1:] + [len(data)]
+    with ProcessPoolExecutor(workers) as pool:
+        chunks: List[Chunk] = list(pool.map(tokenize_chunk, repeat(scanner_cls), repeat(path), starts, ends,
+                                            repeat(kwargs)))
+
+    # lines and chars in front of each chunk
+    line_base = [0] * len(chunks)
+    char_base = [0] * len(chunks)
+    for k in range(1, len(chunks)):
+        line_base[k] = line_base[k - 1] + chunks[k - 1][2]
+        char_base[k] = char_base[k - 1] + chunks[k - 1][3]
+
+    result = TokenArray(scanner.buffer)
+    k = i = 0  # tokens of chunk k are valid from index i on
+    while True:
+        columns, (kind, pos, end, reach, char_pos, line, col), _, _ = chunks[k]
+        kinds, positions, token_ends, reaches, char_positions, lines, cols = columns
+        result.kind.extend(kinds[i:])
+        result.pos.extend(positions[i:])
+        result.end.extend(token_ends[i:])
+        result.reach.extend(reaches[i:])
+        if scanner.track_lines:
+            result.charPos.extend(p + char_base[k] for p in char_positions[i:])
+            result.line.extend(n + line_base[k] for n in lines[i:])
+            line += line_base[k]
+            char_pos += char_base[k]
+        else:  # lines and char positions are all 0
+            result.charPos.extend(char_positions[i:])
+            result.line.extend(lines[i:])
+        result.col.extend(cols[i:])  # chunks start at line starts, columns need no correction
+
+        if k + 1 == len(chunks):  # the token behind the last chunk is EOF
+            result.append(Token(kind, pos, char_pos, col, line), end, reach)
+            return result
+
+        next_positions = chunks[k + 1][0][1]
+        if (next_positions[0] if len(next_positions) > 0 else chunks[k + 1][1][1]) == pos:
+            k, i = k + 1, 0
+            continue
+
+        # the next chunk does not start at a token: scan on until a token of some chunk is met
+        scanner.reset_to(pos, line, col, char_pos)
+        while True:
+            t = scanner.next_token()
+            m = bisect_right(starts, t.pos) - 1
+            if m > k:
+                positions = chunks[m][0][1]
+                i = bisect_left(positions, t.pos)
+                if i < len(positions) and positions[i] == t.pos:
+                    k = m
+                    break
+
+            result.append(t, scanner.pos, scanner.token_reach())
+            if t.kind == scanner.eofSym:
+                return result
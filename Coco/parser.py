@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import sys
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from .errors import Errors
 from .scanner import Scanner, Token
@@ -16,6 +16,17 @@ T_: bool = True
 x_: bool = False
 
 
+def _bitsets(rows: List[List[bool]], width: int) -> Tuple[int, ...]:
+    """ Packs every row of a symbol set matrix into an int bitmask where
+    bit k is set iff token kind k belongs to the set
+    """
+    for i, row in enumerate(rows):
+        if len(row) != width:
+            raise ValueError("symbol set {} has {} entries, expected {}".format(i, len(row), width))
+
+    return tuple(sum(1 << k for k, b in enumerate(row) if b) for row in rows)
+
+
 class Parser:
     _EOF: int = 0
     _ident: int = 1
@@ -85,7 +96,7 @@ class Parser:
             self.syn_err(n)
 
     def start_of(self, s: int) -> bool:
-        return self.set_[s][self.la.kind]
+        return self.set_[s] >> self.la.kind & 1 == 1
 
     def expect_weak(self, n: int, follow: int):
         if self.la.kind == n:
@@ -104,7 +115,8 @@ class Parser:
             return False
 
         self.syn_err(n)
-        while not (self.set_[sy_fol][kind] or self.set_[rep_fol][kind] or self.set_[0][kind]):
+        stop = self.set_[sy_fol] | self.set_[rep_fol] | self.set_[0]
+        while not stop >> kind & 1:
             self.get()
             kind = self.la.kind
 
@@ -347,7 +359,7 @@ class Parser:
                     self.get()
                 beg = self.la.pos
                 self.type_name()
-                sym.retType = self.scanner.buffer.get_string(beg, self.la.pos)
+                sym.retType = self.scanner.buffer.get_source(beg, self.la.pos)
                 self.expect(1)
                 sym.retVar = self.t.val
 
@@ -387,7 +399,7 @@ class Parser:
 
                 beg = self.la.pos
                 self.type_name()
-                sym.retType = self.scanner.buffer.get_string(beg, self.la.pos)
+                sym.retType = self.scanner.buffer.get_source(beg, self.la.pos)
                 self.expect(1)
                 sym.retVar = self.t.val
                 if self.la.kind == 30:
@@ -691,7 +703,7 @@ class Parser:
                         self.get()
                         self.sem_err("bad string in attributes")
 
-                n.retVar = self.scanner.buffer.get_string(beg, self.la.pos)
+                n.retVar = self.scanner.buffer.get_source(beg, self.la.pos)
                 if self.la.kind == 27:
                     self.get()
                 elif self.la.kind == 28:
@@ -748,7 +760,7 @@ class Parser:
                         self.get()
                         self.sem_err("bad string in attributes")
 
-                n.retVar = self.scanner.buffer.get_string(beg, self.la.pos)
+                n.retVar = self.scanner.buffer.get_source(beg, self.la.pos)
                 if self.la.kind == 30:
                     self.get()
                 elif self.la.kind == 28:
@@ -891,7 +903,7 @@ class Parser:
         self.coco()
         self.expect(0)
 
-    set_ = [
+    set_ = _bitsets([
         [T_,T_,x_,T_, x_,T_,x_,x_, x_,x_,T_,T_, x_,x_,x_,T_, T_,T_,x_,x_, x_,x_,x_,x_, x_,x_,x_,x_, x_,x_,x_,x_, x_,x_,x_,x_, x_,x_,x_,x_, x_,x_,T_,x_, x_,x_],
         [x_,T_,T_,T_, T_,T_,x_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,x_],
         [x_,T_,T_,T_, T_,T_,T_,x_, x_,x_,x_,x_, T_,T_,T_,x_, x_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,x_],
@@ -923,4 +935,4 @@ class Parser:
         [x_,T_,T_,T_, x_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,x_,x_,T_, T_,T_,x_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,x_],
         [x_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, x_,T_,T_,T_, T_,T_,T_,T_, T_,x_],
         [x_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, x_,T_,T_,T_, T_,T_,T_,T_, T_,T_,T_,T_, T_,x_]
-    ]
+    ], maxT + 2)
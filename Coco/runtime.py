@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+import re
+from mmap import mmap
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .buffer import Buffer
+from .errors import FatalError
+from .scanner import Scanner, ScannerState, Token
+from .tables import ScannerTables, fast_comment_args
+
+
+# comment delimiters (start, stop, nested) and the arguments of skip_comment() for them (None: no fast path)
+CommentSpec = Tuple[str, str, bool, Optional[Tuple[bytes, bytes, bool]]]
+
+
+class TableScanner(Scanner):
+    """ Scanner that interprets the tables of a scanner DFA (see DFA.make_tables())
+    instead of running a generated state machine. Tokens, scan(), peek(), tokens()
+    and the other Scanner methods behave as those of the generated scanner
+    """
+    tables: Optional[ScannerTables] = None  # tables used if none are passed to the constructor
+
+    ignore_case: bool
+    snapshot_states: Set[int]  # final states from which a non-final state can be reached
+    cut_states: Set[int]       # context states without context transitions: the appendix is cut off here
+    runs: List[Optional['re.Pattern']]  # runs of the ASCII chars that loop in a state, see loop_re()
+    comments: Dict[int, List[CommentSpec]]  # comments by their first char
+
+    def __init__(self, s: Union[str, BinaryIO, bytes, bytearray, mmap, Buffer],
+                 tables: Union[ScannerTables, str, None] = None, max_peek: Optional[int] = None,
+                 track_lines: bool = True):
+        """ tables are ScannerTables or the path of a tables file. A path can also be
+        passed as a keyword argument to tokenize_parallel(), which pickles the arguments
+        """
+        if tables is None:
+            tables = self.tables
+        if tables is None:
+            raise FatalError("No scanner tables")
+        if isinstance(tables, str):
+            tables = ScannerTables.load(tables)
+
+        self.tables = tables
+        self.eofSym = tables.eofSym
+        self.maxT = tables.maxT
+        self.noSym = tables.noSym
+        self.literals = tables.literals
+        self.ignore_case = tables.ignore_case
+        self.ignoredRe = self.run_re(tables.ignored, tables.ignore_case)
+
+        n = tables.n_classes
+        self.snapshot_states = set()
+        self.cut_states = set()
+        for state in range(tables.n_states):
+            row = tables.trans[state * n:(state + 1) * n]
+            if tables.accept[state] >= 0 and any(target != 0 and tables.accept[abs(target)] < 0 for target in row):
+                self.snapshot_states.add(state)
+            if tables.flags[state] & ScannerTables.CTX_STATE and all(target >= 0 for target in row):
+                self.cut_states.add(state)
+
+        self.runs = [self.loop_re(state) for state in range(tables.n_states)]
+
+        self.comments = {}
+        for start, stop, nested in tables.comments:
+            spec = (start, stop, nested, fast_comment_args(start, stop, nested, self.ignore_case))
+            self.comments.setdefault(self.fold(ord(start[0])), []).append(spec)
+
+        super().__init__(s, max_peek, track_lines)
+
+    @staticmethod
+    def run_re(ranges: Iterable[Tuple[int, int]], ignore_case: bool) -> Optional['re.Pattern']:
+        """ Regex for runs of the ASCII chars in the sorted (from, to) ranges, None if there are none
+        """
+        items = []
+        for from_, to in ranges:
+            if from_ > 127:
+                break
+            items.append(re.escape(bytes([from_])) + b'-' + re.escape(bytes([min(to, 127)])))
+
+        if not items:
+            return None
+        return re.compile(b'[' + b''.join(items) + b']+', re.IGNORECASE if ignore_case else 0)
+
+    def loop_re(self, state: int) -> Optional['re.Pattern']:
+        """ Regex for runs of the ASCII chars that loop in state, for add_run(); see DFA.run_class()
+        """
+        tables = self.tables
+        if tables.flags[state] & ScannerTables.CTX_STATE:
+            return None
+
+        row = state * tables.n_classes
+        chars = [ch for ch in range(128)
+                 if ch not in (10, 13) and not (self.ignore_case and chr(ch).isupper()) and
+                 tables.trans[row + tables.low_classes[ch]] == state]
+        return self.run_re(((ch, ch) for ch in chars), self.ignore_case)
+
+    def fold(self, ch: int) -> int:
+        """ The char the tables see for ch: ch itself or its lower case form if case is ignored
+        """
+        if self.ignore_case and ch != Buffer.EOF:
+            lower = chr(ch).lower()
+            if len(lower) == 1:
+                return ord(lower)
+        return ch
+
+    def is_ignored(self, ch: int) -> bool:
+        for from_, to in self.tables.ignored:
+            if ch <= to:
+                return ch >= from_
+        return False
+
+    def comment(self, start: str, stop: str, nested: bool, fast_args: Optional[Tuple[bytes, bytes, bool]]) -> bool:
+        """ Skips a comment that starts at ch, the generic form of the commentN() methods
+        of generated scanners
+        """
+        fold = self.fold
+        level = 1
+        state0 = self.save()
+        line0 = self.line
+
+        self.next_ch()
+        if len(start) == 2:
+            if fold(self.ch) != ord(start[1]):
+                self.restore(state0)
+                return False
+            self.next_ch()
+
+        if fast_args is not None and self.skip_comment(*fast_args, line0):
+            return True
+
+        while True:
+            ch = fold(self.ch)
+            if ch == ord(stop[0]):
+                if len(stop) == 2:
+                    self.next_ch()
+                    if fold(self.ch) != ord(stop[1]):
+                        continue
+                level -= 1
+                if level == 0:
+                    self.old_eols = self.line - line0
+                    self.next_ch()
+                    return True
+                self.next_ch()
+
+            elif nested and ch == ord(start[0]):
+                self.next_ch()
+                if len(start) == 1:
+                    level += 1
+                elif fold(self.ch) == ord(start[1]):
+                    level += 1
+                    self.next_ch()
+
+            elif ch == Buffer.EOF:
+                return False
+
+            else:
+                self.next_ch()
+
+    def check_literal(self):
+        val = self.t.val
+        bucket = self.literals.get(len(val))
+        if bucket is not None:
+            kind = bucket.get(val.lower() if self.ignore_case else val)
+            if kind is not None:
+                self.t.kind = kind
+
+    def next_token(self) -> Token:
+        tables = self.tables
+        ignore_case = self.ignore_case
+        fold = self.fold
+
+        while self.is_ignored(fold(self.ch)):
+            self.skip_ignored()
+
+        comments = self.comments.get(fold(self.ch))
+        if comments is not None and any(self.comment(*spec) for spec in comments):
+            return self.next_token()
+
+        rec_kind = self.noSym
+        rec_end: Optional[ScannerState] = None  # position behind the longest token recognized so far
+        rec_len = 0
+        apx = 0  # length of the appendix of a context token
+        ctx_end: Optional[ScannerState] = None  # position in front of the appendix
+        ctx_len = 0
+
+        self.t = Token()
+        self.t.pos = self.pos
+        self.t.col = self.col
+        self.t.line = self.line
+        self.t.charPos = self.char_pos
+        self.tval = []
+
+        if self.ch == Buffer.EOF:
+            self.t.kind = self.eofSym
+            self.t.val = ''
+            return self.t
+
+        trans = tables.trans
+        accept = tables.accept
+        flags = tables.flags
+        low_classes = tables.low_classes
+        char_class = tables.char_class
+        n_classes = tables.n_classes
+        snapshot_states = self.snapshot_states
+        runs = self.runs
+
+        state = tables.start_state
+        while True:
+            run = runs[state]
+            if run is not None:
+                self.add_run(run)
+
+            kind = accept[state]
+            if kind >= 0:
+                rec_kind = kind
+                if state in snapshot_states:
+                    rec_end = self.save()
+                    rec_len = len(self.tval)
+
+            ch = fold(self.ch) if ignore_case else self.ch
+            target = trans[state * n_classes + (low_classes[ch] if ch < 256 else char_class(ch))]
+            if target == 0:
+                break
+
+            if target < 0:  # context transition: the char belongs to the appendix
+                if apx == 0:
+                    ctx_end = self.save()
+                    ctx_len = len(self.tval)
+                apx += 1
+                target = -target
+            elif flags[state] & ScannerTables.CTX_STATE:
+                apx = 0
+
+            self.add_ch()
+            state = target
+
+        if state in self.cut_states and apx > 0:
+            self.set_scanner_behind_T(ctx_end, ctx_len)
+
+        kind = accept[state]
+        if kind >= 0:
+            self.t.kind = kind
+            self.t.val = ''.join(self.tval)
+            if flags[state] & ScannerTables.CHECK_LITERAL:
+                self.check_literal()
+            return self.t
+
+        if rec_kind != self.noSym:
+            self.set_scanner_behind_T(rec_end, rec_len)
+        elif not self.tval:  # no token starts with ch: it becomes a noSym token
+            self.add_ch()
+        self.t.kind = rec_kind
+        self.t.val = ''.join(self.tval)
+        return self.t
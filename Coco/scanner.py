@@ -1,19 +1,90 @@
 # -*- coding: utf-8 -*-
 
-from typing import BinaryIO, Union, Dict
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from mmap import mmap
+from asyncio import StreamReader
+from typing import Any, AsyncIterator, BinaryIO, Union, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
 
 from .errors import FatalError
-from .buffer import Buffer, UTF8Buffer
+from .buffer import Buffer, LineIndex, AsyncBuffer, NeedMoreData
 
 
 class Token:
+    __slots__ = ('kind', 'pos', 'charPos', 'col', 'line', 'val')
+
     kind: int      # token kind
     pos: int       # token position in bytes in the source text (starting at 0)
     charPos: int   # token position in characters in the source text (starting at 0)
     col: int       # token column (starting at 1)
     line: int      # token line (starting at 1)
     val: str       # token value
-    next: 'Token'  # ML 2005-03-11 Peek tokens are kept in linked list
+
+    def __init__(self, kind: int = 0, pos: int = 0, char_pos: int = 0, col: int = 0, line: int = 0, val: str = ''):
+        self.kind = kind
+        self.pos = pos
+        self.charPos = char_pos
+        self.col = col
+        self.line = line
+        self.val = val
+
+
+class ScannerState(NamedTuple):
+    """ Snapshot of the scanner position, see Scanner.save() and Scanner.restore()
+    """
+    buf_pos: int    # buffer position of the character behind ch
+    pos: int
+    ch: int
+    line: int
+    col: int
+    char_pos: int
+    old_eols: int
+    val_ch: Optional[str]  # ch before case folding (scanners of IGNORECASE grammars only)
+
+
+class TokenArray:
+    """ Columnar token list: token attributes are kept in parallel int arrays
+    and token values are sliced from the source buffer only when requested.
+    Values are the raw source text of the token.
+    """
+    buffer: Buffer
+    kind: array
+    pos: array
+    end: array      # byte position just behind the token
+    reach: array    # byte position behind the furthest char read to scan the token
+    charPos: array
+    line: array
+    col: array
+
+    def __init__(self, buffer: Buffer):
+        self.buffer = buffer
+        self.kind = array('i')
+        self.pos = array('i')
+        self.end = array('i')
+        self.reach = array('i')
+        self.charPos = array('i')
+        self.line = array('i')
+        self.col = array('i')
+
+    def __len__(self):
+        return len(self.kind)
+
+    def append(self, t: Token, end: int, reach: int):
+        self.kind.append(t.kind)
+        self.pos.append(t.pos)
+        self.end.append(end)
+        self.reach.append(reach)
+        self.charPos.append(t.charPos)
+        self.line.append(t.line)
+        self.col.append(t.col)
+
+    def val(self, i: int) -> str:
+        return self.buffer.get_string(self.pos[i], self.end[i])
+
+    def __getitem__(self, i: int) -> Token:
+        return Token(self.kind[i], self.pos[i], self.charPos[i], self.col[i], self.line[i], self.val(i))
 
 
 class Scanner:
@@ -21,6 +92,10 @@ class Scanner:
     eofSym: int = 0
     maxT: int = 44
     noSym: int = 44
+    maxPeek: int = 16  # default capacity of the lookahead ring
+    ignoredRe: Optional['re.Pattern'] = re.compile(rb'[\x09\x0a\x0d\x20]+')  # runs of ignored ASCII chars
+    _run1: 're.Pattern' = re.compile(rb'[\x30-\x39\x41-\x5a\x5f\x61-\x7a]+')  # ASCII chars that loop in state 1
+    _run2: 're.Pattern' = re.compile(rb'[\x30-\x39]+')  # ASCII chars that loop in state 2
 
     buffer: Buffer    # scanner buffer
     t: Token          # current token
@@ -30,71 +105,59 @@ class Scanner:
     col: int          # column number of current character
     line: int         # line number of current character
     old_eols: int     # EOLs that appeared in a comment;
-
-    start: Dict[int, int]  # maps initial token character to start state
-    literals: dict         # maps literal strings to literal kinds
-
-    tokens: Token     # list of tokens already peeked (first token is a dummy)
-    pt: Token         # current peek token
-
-    tval: str         # token text used in NextToken(), dynamically enlarged
+    line_index: Optional[LineIndex] = None  # answers line_col() queries
+    track_lines: bool = True  # False: lines, columns and char positions are fixed to 0
+
+    # maps initial token character < 256 to start state
+    start: array = array('i', (
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0, 12,  0, 13,  0,  0,  5, 35, 28,  0, 17, 22, 18, 33,  0,
+         2,  2,  2,  2,  2,  2,  2,  2,  2,  2,  0,  0, 34, 16, 21,  0,
+         0,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,
+         1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1, 25,  0, 26, 20,  1,
+         0,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1,
+         1,  1,  1,  1,  1,  1,  1,  1,  1,  1,  1, 29, 27, 30,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+         0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
+    ))
+    # start states of characters >= 256 as sorted (from, to, state) ranges
+    startRanges: Tuple[Tuple[int, int, int], ...] = (
+        (Buffer.EOF, Buffer.EOF, -1),
+    )
+
+    # maps literal strings to literal kinds, bucketed by string length
+    literals: Dict[int, Dict[str, int]] = {
+        2: {"TO": 13, "IF": 40},
+        3: {"END": 19, "ANY": 23, "out": 26},
+        4: {"FROM": 12, "WEAK": 34, "SYNC": 39},
+        6: {"TOKENS": 9, "NESTED": 14, "IGNORE": 15},
+        7: {"PRAGMAS": 10, "CONTEXT": 41},
+        8: {"COMPILER": 6, "COMMENTS": 11},
+        10: {"IGNORECASE": 7, "CHARACTERS": 8},
+        11: {"PRODUCTIONS": 16},
+    }
+
+    ring: List[Optional[Token]]  # tokens already peeked, ring_count of them starting at ring_head
+    ring_end: List[int]  # byte position behind each ring token, as self.pos when it was scanned
+    ring_reach: List[int]  # token_reach() of each ring token
+    max_peek: int     # how many tokens (pragmas not counted) peek() can look ahead
+    ring_head: int    # ring slot of the next token returned by scan()
+    ring_count: int   # number of tokens in the ring
+    peek_pos: int     # number of ring tokens already returned by peek()
+
+    tval: List[str]   # token text used in NextToken(), joined once the token is accepted
+    reach: int        # buffer position behind the furthest char read before a restore(), see token_reach()
 
     def init(self):
-        self.start = dict()
-        self.literals = dict()
-
-        for i in range(65, 91):
-            self.start[i] = 1
-
-        self.start[95] = 1
-
-        for i in range(97, 123):
-            self.start[i] = 1
-
-        for i in range(48, 58):
-            self.start[i] = 2
-
-        self.start[34] = 12
-        self.start[39] = 5
-        self.start[36] = 13
-        self.start[61] = 16
-        self.start[46] = 33
-        self.start[43] = 17
-        self.start[45] = 18
-        self.start[60] = 34
-        self.start[94] = 20
-        self.start[62] = 21
-        self.start[44] = 22
-        self.start[91] = 25
-        self.start[93] = 26
-        self.start[124] = 27
-        self.start[40] = 35
-        self.start[41] = 28
-        self.start[123] = 29
-        self.start[125] = 30
-        self.start[Buffer.EOF] = -1
-        
-        self.literals["COMPILER"] = 6
-        self.literals["IGNORECASE"] = 7
-        self.literals["CHARACTERS"] = 8
-        self.literals["TOKENS"] = 9
-        self.literals["PRAGMAS"] = 10
-        self.literals["COMMENTS"] = 11
-        self.literals["FROM"] = 12
-        self.literals["TO"] = 13
-        self.literals["NESTED"] = 14
-        self.literals["IGNORE"] = 15
-        self.literals["PRODUCTIONS"] = 16
-        self.literals["END"] = 19
-        self.literals["ANY"] = 23
-        self.literals["out"] = 26
-        self.literals["WEAK"] = 34
-        self.literals["SYNC"] = 39
-        self.literals["IF"] = 40
-        self.literals["CONTEXT"] = 41
-
         self.pos = self.char_pos = -1
-        self.col = self.old_eols = 0
+        self.col = self.old_eols = self.reach = 0
         self.line = 1
 
         self.next_ch()
@@ -108,15 +171,30 @@ class Scanner:
             if ch1 != 0xBB or ch2 != 0xBF:
                 raise FatalError("Illegal byte order mark at start of file")
 
-            self.buffer = UTF8Buffer(self.buffer)
+            self.buffer = self.buffer.to_utf8()
             self.col = 0
             self.char_pos = -1
             self.next_ch()
 
-        self.pt = self.tokens = Token()
+        if not self.track_lines:
+            self.line = self.col = self.char_pos = 0
+        self.ring_head = self.ring_count = self.peek_pos = 0
 
-    def __init__(self, s: Union[str, BinaryIO]):
-        self.buffer = Buffer(s)
+    def __init__(self, s: Union[str, BinaryIO, bytes, bytearray, mmap, Buffer], max_peek: Optional[int] = None,
+                 track_lines: bool = True):
+        """ A Buffer passed as s is used as it is.
+        With track_lines=False the scanner only records byte positions: the line,
+        col and charPos of all tokens are 0, and line_col(t.pos) is the only source
+        of the line and column of a token t
+        """
+        self.buffer = s if isinstance(s, Buffer) else Buffer(s)
+        self.max_peek = max_peek or self.maxPeek
+        self.ring = [None] * self.max_peek
+        self.ring_end = [0] * len(self.ring)
+        self.ring_reach = [0] * len(self.ring)
+        self.track_lines = track_lines
+        if not track_lines:
+            self.next_ch = self.next_ch_untracked
         self.init()
 
     def next_ch(self):
@@ -139,21 +217,156 @@ class Scanner:
             self.line += 1
             self.col = 0
 
+    def next_ch_untracked(self):
+        """ next_ch() without line, column and char position bookkeeping
+        """
+        if self.old_eols > 0:
+            self.ch = self.EOL
+            self.old_eols -= 1
+            return
+
+        self.pos = self.buffer.get_pos()
+        self.ch = self.buffer.read()
+        if self.ch == 13 and self.buffer.peek() != 10:  # isolated '\r'
+            self.ch = self.EOL
+
+    def line_col(self, pos: int) -> Tuple[int, int]:
+        """ Returns the (line, col) of byte position pos, computed from an index
+        of line starts that is built on first use
+        """
+        if self.line_index is None:
+            self.line_index = LineIndex(self.buffer)
+        return self.line_index.line_col(pos)
+
+    def skip_to(self, end: int):
+        """ Moves behind the bytes buffer.buf[buffer.buf_pos:end] doing the bookkeeping
+        of next_ch() for all of them at once; the next call of next_ch() reads buffer.buf[end].
+        end must lie inside the buffer window, so that a '\\r' at the end can be classified
+        """
+        buffer = self.buffer
+        if not self.track_lines:
+            buffer.buf_pos = end
+            return
+
+        data = buffer.buf[buffer.buf_pos:end]
+        n = buffer.char_count(data)
+        self.char_pos += n
+
+        last = max(data.rfind(b'\n'), data.rfind(b'\r'))
+        if last >= 0:
+            eols = data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n')
+            if last == len(data) - 1 and data[last] == 13 and buffer.buf[end] == 10:  # '\r' of a '\r\n'
+                eols -= 1
+                last = max(data.rfind(b'\n', 0, last), data.rfind(b'\r', 0, last))
+            self.line += eols
+
+        if last >= 0:
+            self.col = buffer.char_count(data[last + 1:])
+        else:
+            self.col += n
+
+        buffer.buf_pos = end
+
+    def skip_ignored(self):
+        """ Skips the ignored character ch and the run of ignored characters behind it
+        with one regex match over the buffer window
+        """
+        buffer = self.buffer
+        if self.old_eols == 0 and self.ignoredRe is not None:
+            # stop one byte before the end of the window, skip_to() must see the byte behind the run
+            m = self.ignoredRe.match(buffer.buf, buffer.buf_pos, buffer.buf_len - 1)
+            if m is not None and m.end() > buffer.buf_pos:
+                self.skip_to(m.end())
+                self.next_ch()
+                return
+
+        self.next_ch()
+
+    def save(self) -> ScannerState:
+        """ Snapshot of the current position that restore() can return to
+        """
+        return ScannerState(self.buffer.get_pos(), self.pos, self.ch, self.line, self.col, self.char_pos,
+                            self.old_eols, getattr(self, 'valCh', None))
+
+    def restore(self, state: ScannerState):
+        """ Moves the scanner back (or forth) to a position saved by save()
+        without reading any characters again
+        """
+        pos = self.buffer.get_pos()
+        if pos > self.reach:  # chars behind the snapshot have been read
+            self.reach = pos
+        self.buffer.set_pos(state.buf_pos)
+        self.pos = state.pos
+        self.ch = state.ch
+        self.line = state.line
+        self.col = state.col
+        self.char_pos = state.char_pos
+        self.old_eols = state.old_eols
+        if state.val_ch is not None:
+            self.valCh = state.val_ch
+
+    def reset_to(self, pos: int, line: int, col: int, char_pos: int):
+        """ Moves the scanner to byte position pos, the position of the char at
+        line, col and char_pos (e.g. the start of a token scanned earlier)
+        """
+        self.old_eols = self.reach = 0
+        self.buffer.set_pos(pos)
+        self.next_ch()
+        if not self.track_lines:
+            return
+
+        self.line = line
+        self.col = col
+        self.char_pos = char_pos
+        if self.ch == self.EOL:  # as in next_ch(), an EOL counts for the next line
+            self.line += 1
+            self.col = 0
+
+    def token_reach(self) -> int:
+        """ Buffer position behind the furthest char read to scan the token just scanned,
+        including chars read before restore() moved the scanner back; next_ch() may also
+        have peeked at the byte there. Called once per token
+        """
+        reach = max(self.reach, self.buffer.get_pos())
+        self.reach = 0
+        return reach
+
     def add_ch(self):
         if self.ch != Buffer.EOF:
-            self.tval += chr(self.ch)
+            self.tval.append(chr(self.ch))
             self.next_ch()
 
+    def add_run(self, run_re: 're.Pattern') -> bool:
+        """ Adds ch and the chars behind it to the token text as long as run_re matches them,
+        with one regex match over the buffer window instead of an add_ch() call per char.
+        run_re has to match runs of ASCII chars other than line breaks.
+        Returns True if any char was added
+        """
+        buffer = self.buffer
+        if self.old_eols > 0:
+            return False
+
+        i = self.pos - buffer.buf_start  # window index of ch
+        # stop one byte before the end of the window, skip_to() must see the byte behind the run
+        m = run_re.match(buffer.buf, i, buffer.buf_len - 1)
+        if m is None:
+            return False
+
+        self.tval.extend(buffer.buf[i:m.end()].decode('ascii'))
+        self.skip_to(m.end())
+        self.next_ch()
+        return True
+
     def comment0(self) -> bool:
         level = 1
-        pos0 = self.pos
+        state0 = self.save()
         line0 = self.line
-        col0 = self.col
-        char_pos0 = self.char_pos
 
         self.next_ch()
         if self.ch == ord('/'):
             self.next_ch()
+            if self.skip_comment(b'//', b'\n', False, line0):
+                return True
             while True:
                 if self.ch == ord('\n'):
                     level -= 1
@@ -169,23 +382,19 @@ class Scanner:
                 else:
                     self.next_ch()
         else:
-            self.buffer.set_pos(pos0)
-            self.next_ch()
-            self.line = line0
-            self.col = col0
-            self.char_pos = char_pos0
+            self.restore(state0)
         return False
 
     def comment1(self) -> bool:
         level = 1
-        pos0 = self.pos
+        state0 = self.save()
         line0 = self.line
-        col0 = self.col
-        char_pos0 = self.char_pos
 
         self.next_ch()
         if self.ch == ord('*'):
             self.next_ch()
+            if self.skip_comment(b'/*', b'*/', True, line0):
+                return True
             while True:
                 if self.ch == ord('*'):
                     self.next_ch()
@@ -206,26 +415,78 @@ class Scanner:
                 else:
                     self.next_ch()
         else:
-            self.buffer.set_pos(pos0)
-            self.next_ch()
-            self.line = line0
-            self.col = col0
-            self.char_pos = char_pos0
+            self.restore(state0)
         return False
 
+    EOL_STOP = re.compile(rb'\n|\r(?!\n)')  # where next_ch() reports an EOL
+
+    def skip_comment(self, start: bytes, stop: bytes, nested: bool, line0: int) -> bool:
+        """ Skips the rest of a comment whose body starts at ch by searching the buffer
+        window for the stop (and nested start) delimiters. Behaves like the char-wise
+        comment loop if the end of the comment lies inside the window and returns True;
+        otherwise returns False without moving, so the char-wise loop takes over
+        """
+        if self.old_eols > 0 or nested and start[:1] == stop[:1]:
+            return False  # the char-wise loop would check the stop delimiter first
+
+        buffer = self.buffer
+        buf = buffer.buf
+        end = buffer.buf_len
+        i = self.pos - buffer.buf_start  # window index of ch
+        level = 1
+        while level > 0:
+            if stop == b'\n':
+                m = self.EOL_STOP.search(buf, i, end)
+                if m is None or m.end() == end and buf[end - 1] == 13:  # a '\r' at the window end cannot be classified
+                    return False
+                j = m.start()
+            else:
+                j = buf.find(stop, i, end)
+                if j < 0:
+                    return False
+
+            if nested:
+                # a nested comment opens if its start delimiter begins in front of the stop
+                # delimiter, also if the two overlap: the char-wise loop reads '/*/' as '/*'
+                k = buf.find(start, i, min(j + len(start) - 1, end))
+                if k >= 0:
+                    level += 1
+                    i = k + len(start)
+                    continue
+
+            level -= 1
+            i = j + len(stop)
+
+        self.skip_to(i)
+        self.old_eols = self.line - line0
+        self.next_ch()
+        return True
+
+    def start_state(self, ch: int) -> int:
+        """ Start state of a character >= 256
+        """
+        i = bisect_right(self.startRanges, (ch, Buffer.EOF, 0)) - 1
+        if i >= 0 and ch <= self.startRanges[i][1]:
+            return self.startRanges[i][2]
+        return 0
+
     def check_literal(self):
         val = self.t.val
-        kind = self.literals.get(val)
-        if kind is not None:
-            self.t.kind = kind
+        bucket = self.literals.get(len(val))
+        if bucket is not None:  # only strings with the length of some literal are looked up
+            kind = bucket.get(val)
+            if kind is not None:
+                self.t.kind = kind
 
     def next_token(self) -> Token:
         while self.ch in (ord(' '), 9, 10, 13):
-            self.next_ch()
+            self.skip_ignored()
 
         if self.ch == ord('/') and (self.comment0() or self.comment1()):
             return self.next_token()
 
+        # no final state of this scanner leads to a non-final one, so state 0 is only reached
+        # with rec_kind == noSym and needs no rec_end snapshot (see DFA.write_state())
         rec_kind = self.noSym
 
         self.t = Token()
@@ -234,38 +495,44 @@ class Scanner:
         self.t.line = self.line
         self.t.charPos = self.char_pos
 
-        state: int = self.start.get(self.ch, 0)
-        self.tval = ''
+        state: int = self.start[self.ch] if self.ch < 256 else self.start_state(self.ch)
+        self.tval = []
         self.add_ch()
 
         while True:
-            ch: str = chr(self.ch)
+            # EOF must not match any character class: U+10FFFF is a noncharacter
+            ch: str = chr(self.ch) if self.ch != Buffer.EOF else '\U0010FFFF'
             if state == -1:
                 self.t.kind = self.eofSym
                 break
 
             elif state == 0:
-                if rec_kind != self.noSym:
-                    self.set_scanner_behind_T()
                 self.t.kind = rec_kind
                 break
 
             elif state == 1:
+                if self.add_run(self._run1):
+                    ch = chr(self.ch) if self.ch != Buffer.EOF else '\U0010FFFF'
                 rec_kind = 1
                 if ch.isalnum() or ch == '_':
                     self.add_ch()
                     state = 1
                 else:
                     self.t.kind = 1
-                    self.t.val = self.tval
+                    self.t.val = ''.join(self.tval)
                     self.check_literal()
                     return self.t
 
             elif state == 2:
+                if self.add_run(self._run2):
+                    ch = chr(self.ch) if self.ch != Buffer.EOF else '\U0010FFFF'
                 rec_kind = 2
                 if ch.isnumeric():
                     self.add_ch()
                     state = 2
+                else:
+                    self.t.kind = 2
+                    break
 
             elif state == 3:
                 self.t.kind = 3
@@ -303,7 +570,7 @@ class Scanner:
             elif state == 8:
                 if '0' <= ch <= '9' or 'a' <= ch <= 'f':
                     self.add_ch()
-                elif state == 39:
+                elif self.ch == 39:
                     self.add_ch()
                     state = 9
                 else:
@@ -480,42 +747,230 @@ class Scanner:
                     self.t.kind = 35
                     break
 
-        self.t.val = self.tval
+        self.t.val = ''.join(self.tval)
         return self.t
 
-    def set_scanner_behind_T(self):
-        self.buffer.set_pos(self.t.pos)
-        self.next_ch()
-        self.line = self.t.line
-        self.col = self.t.col
-        self.char_pos = self.t.charPos
+    def set_scanner_behind_T(self, state: ScannerState, tlen: int):
+        """ Moves the scanner behind the first tlen characters of the current token.
+        state is a snapshot saved at that point
+        """
+        self.restore(state)
+        del self.tval[tlen:]
 
-        for _ in self.tval:
-            self.next_ch()
+    def tokens(self) -> Iterator[Token]:
+        """ Yields the remaining tokens (pragmas included) up to and including EOF.
+        The scanner keeps no reference to tokens already yielded
+        """
+        scan = self.scan
+        eof_sym = self.eofSym
+        while True:
+            t = scan()
+            yield t
+            if t.kind == eof_sym:
+                return
+
+    def tokenize_all(self, columnar: bool = False) -> Union[List[Token], TokenArray]:
+        """ Scans the rest of the input in one batch, either into a list of tokens
+        or into a TokenArray (EOF token included)
+        """
+        if columnar:
+            return self.tokenize_columnar()
+
+        result: List[Token] = []
+        append = result.append
+        scan = self.scan
+        eof_sym = self.eofSym
+        while True:
+            t = scan()
+            append(t)
+            if t.kind == eof_sym:
+                return result
+
+    def tokenize_columnar(self) -> TokenArray:
+        """ Scans the rest of the input into a TokenArray (EOF token included)
+        """
+        result = TokenArray(self.buffer)
+        append = result.append
+        eof_sym = self.eofSym
+        while self.ring_count > 0:  # tokens already peeked: scanner position is further ahead
+            end = self.ring_end[self.ring_head]
+            reach = self.ring_reach[self.ring_head]
+            t = self.scan()
+            append(t, end, reach)
+            if t.kind == eof_sym:
+                return result
+
+        next_token = self.next_token
+        get_pos = self.buffer.get_pos
+        while True:
+            t = next_token()
+            reach = get_pos()
+            if self.reach > 0:  # the scanner went back, see token_reach()
+                reach = max(reach, self.reach)
+                self.reach = 0
+            append(t, self.pos, reach)  # self.pos is the position of the char behind the token
+            if t.kind == eof_sym:
+                return result
+
+    @classmethod
+    def relex(cls, old: TokenArray, source: Union[bytes, bytearray, mmap], offset: int, deleted: int,
+              inserted: int, **kwargs) -> TokenArray:
+        """ Tokenizes source, the text of old.buffer after replacing the deleted bytes at
+        byte position offset with inserted bytes, reusing the tokens of old outside the edit.
+        Scanning restarts one token before the first token whose scan read up to the edit
+        (see TokenArray.reach; the token in front covers the text in between) and stops
+        at the first token that starts where an old token behind the edit starts: from there
+        on the token streams are the same up to the shift.
+        kwargs are passed to the scanner constructor
+        """
+        scanner = cls(source, **kwargs)
+        delta = inserted - deleted
+        n = len(old)
+
+        # tokens ending at or behind the offset read up to it, tokens in front of them may have
+        # done so before falling back to a shorter token
+        r = bisect_left(old.end, offset)
+        r = max(bisect_left(array('i', accumulate(old.reach[:r], max)), offset) - 1, 0)  # first token scanned again
+        result = TokenArray(scanner.buffer)
+        for name in ('kind', 'pos', 'end', 'reach', 'charPos', 'line', 'col'):
+            setattr(result, name, getattr(old, name)[:r])
+        if r > 0:
+            scanner.reset_to(old.pos[r], old.line[r], old.col[r], old.charPos[r])
+
+        edit_end = offset + inserted
+        j = bisect_left(old.pos, offset + deleted)  # first old token behind the edit
+        while True:
+            t = scanner.next_token()
+            if t.pos >= edit_end:
+                while j < n and old.pos[j] + delta < t.pos:
+                    j += 1
+                if j < n and old.pos[j] + delta == t.pos:  # back in sync
+                    break
+
+            result.append(t, scanner.pos, scanner.token_reach())
+            if t.kind == cls.eofSym:
+                return result
+
+        line_delta = t.line - old.line[j]
+        char_delta = t.charPos - old.charPos[j]
+        col_delta = t.col - old.col[j]
+        result.kind.extend(old.kind[j:])
+        result.pos.extend(p + delta for p in old.pos[j:])
+        result.end.extend(p + delta for p in old.end[j:])
+        result.reach.extend(p + delta for p in old.reach[j:])
+        result.charPos.extend(p + char_delta for p in old.charPos[j:])
+        result.line.extend(line + line_delta for line in old.line[j:])
+
+        # only the columns of tokens on the line of the sync token change
+        first = len(result.col)
+        result.col.extend(old.col[j:])
+        line = result.line[first]
+        for i in range(first, len(result.col)):
+            if result.line[i] != line:
+                break
+            result.col[i] += col_delta
+
+        return result
 
     def scan(self) -> Token:
         """ Get the next token (possibly a token already seen during peeking)
         """
-        if self.tokens is None:
+        self.peek_pos = 0
+        if self.ring_count == 0:
             return self.next_token()
 
-        self.pt = self.tokens = self.tokens.next
-        return self.tokens
+        t = self.ring[self.ring_head]
+        self.ring[self.ring_head] = None  # the slot is recycled, drop the reference
+        self.ring_head = (self.ring_head + 1) % len(self.ring)
+        self.ring_count -= 1
+        return t
 
-    def peek(self) -> Token:
-        """ Get the next token, ignore pragmas
+    def peek(self, k: int = 1) -> Token:
+        """ Advance the peek position by k tokens and return the token there; ignore pragmas
         """
+        ring = self.ring
+        size = len(ring)
         while True:
-            if self.pt.next is None:
-                self.pt.next = self.next_token()
-
-            self.pt = self.pt.next
-            if self.pt.kind > self.maxT:
-                continue  # skip pragmas
-
-        return self.pt
+            if self.peek_pos == self.ring_count:
+                if self.ring_count == size:
+                    if sum(1 for t in ring if t.kind <= self.maxT) >= self.max_peek:
+                        raise FatalError("Cannot peek more than {} tokens ahead".format(self.max_peek))
+                    self.grow_ring()  # pragmas filled the ring
+                    ring = self.ring
+                    size = len(ring)
+                slot = (self.ring_head + self.ring_count) % size
+                ring[slot] = self.next_token()
+                self.ring_end[slot] = self.pos
+                self.ring_reach[slot] = self.token_reach()
+                self.ring_count += 1
+
+            t = ring[(self.ring_head + self.peek_pos) % size]
+            self.peek_pos += 1
+            if t.kind <= self.maxT:  # skip pragmas
+                k -= 1
+                if k == 0:
+                    return t
+
+    def grow_ring(self):
+        """ Doubles the capacity of the full ring, keeping the order of its tokens
+        """
+        size = len(self.ring)
+        slots = [(self.ring_head + i) % size for i in range(self.ring_count)]
+        self.ring = [self.ring[i] for i in slots] + [None] * size
+        self.ring_end = [self.ring_end[i] for i in slots] + [0] * size
+        self.ring_reach = [self.ring_reach[i] for i in slots] + [0] * size
+        self.ring_head = 0
 
     def reset_peek(self):
         """ Make sure that peeking starts at current scan position
         """
-        self.pt = self.tokens
+        self.peek_pos = 0
+
+
+class AsyncScanner:
+    """ Runs a scanner over an asyncio StreamReader. Tokens are scanned synchronously as
+    long as the input received so far suffices; only if the scanner needs a char that has
+    not arrived yet, the scanner goes back to where the token started and awaits more input.
+    Input in front of the current token is released
+    """
+    scanner_cls: Type[Scanner]
+    kwargs: Dict[str, Any]    # passed to the scanner constructor
+    buffer: AsyncBuffer
+    scanner: Optional[Scanner]  # created when the first token is requested
+
+    def __init__(self, scanner_cls: Type[Scanner], reader: StreamReader, **kwargs):
+        self.scanner_cls = scanner_cls
+        self.kwargs = kwargs
+        self.buffer = AsyncBuffer(reader)
+        self.scanner = None
+
+    async def start(self):
+        while True:
+            try:
+                self.scanner = self.scanner_cls(self.buffer, **self.kwargs)
+                return
+            except NeedMoreData:  # start of the input (and byte order mark) not complete
+                self.buffer.set_pos(0)
+                await self.buffer.fill(0)
+
+    async def next_token(self) -> Token:
+        if self.scanner is None:
+            await self.start()
+
+        scanner = self.scanner
+        while True:
+            state = scanner.save()
+            try:
+                return scanner.next_token()
+            except NeedMoreData:
+                scanner.restore(state)
+                await scanner.buffer.fill(state.pos)
+
+    async def tokens(self) -> AsyncIterator[Token]:
+        """ Yields the remaining tokens (pragmas included) up to and including EOF
+        """
+        while True:
+            t = await self.next_token()
+            yield t
+            if t.kind == self.scanner.eofSym:
+                return
@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from typing import NamedTuple, Optional, List, Union, Set
+from typing import NamedTuple, Optional, List, Union, Set, TYPE_CHECKING
 from collections import defaultdict
 
 from .charset import CharSet
-from .parser import Parser
 from .errors import Errors
 from .trace import Trace
-from .dfa import State
 
 from . import constants
 
+if TYPE_CHECKING:  # tab, parser and dfa import each other
+    from .parser import Parser
+    from .dfa import State
+
 
 class Position(NamedTuple):
     beg: int
@@ -58,7 +60,7 @@ class Symbol:
         return self.n
 
     def __eq__(self, other):
-        return self.n == other.n
+        return isinstance(other, Symbol) and self.n == other.n
 
 
 class Node:
@@ -149,14 +151,17 @@ class Tab:
     frameDir: str
     outDir: str
     checkEOF: bool = False
+    scannerTables: bool = False  # also write the scanner DFA as Scanner.tables, see ScannerTables
+    scannerRuns: bool = False  # generated scanners consume runs of looping ASCII chars by regex, see Scanner.add_run()
+    scannerDispatch: str = 'chain'  # state dispatch of generated scanners: 'chain' (elif chain) or 'tree'
 
     visited: Set[int]
     curSy: Symbol
-    parser: Parser
+    parser: 'Parser'
     trace: Trace
     errors: Errors
 
-    def __init__(self, parser: Parser):
+    def __init__(self, parser: 'Parser'):
         self.parser = parser
         self.trace = parser.trace
         self.errors = parser.errors
@@ -392,10 +397,22 @@ class Tab:
     # ---------------- graph deletability check ---------------------
 
     def del_graph(self, p: Node) -> bool:
-        return p is None or self.del_node(p) and self.del_graph(p.next)
+        while p is not None:
+            if not self.del_node(p):
+                return False
+            p = p.next
+
+        return True
 
     def del_sub_graph(self, p: Node) -> bool:
-        return p is None or self.del_node(p) and (p.up or self.del_sub_graph(p.next))
+        while p is not None:
+            if not self.del_node(p):
+                return False
+            if p.up:
+                break
+            p = p.next
+
+        return True
 
     def del_node(self, p: Node) -> bool:
         if p.typ == Node.nt:
@@ -534,26 +551,35 @@ class Tab:
 
     def first0(self, p: Node, mark: Set[int]) -> Set[int]:
         fs: Set[int] = set()
-        while p is not None and p.n not in mark:
-            mark.add(p.n)
-            if p.typ == Node.nt:
-                if p.sym.firstReady:
-                    fs.update(p.sym.first)
-                else:
-                    fs.update(self.first0(p.sym.graph, mark))
-            elif p.typ in (Node.t, Node.wt):
-                fs.add(p.sym.n)
-            elif p.typ == Node.any:
-                fs.update(p.set_)
-            elif p.typ == Node.alt:
-                fs.update(self.first0(p.sub, mark))
-                fs.update(self.first0(p.down, mark))
-            elif p.typ in (Node.iter, Node.opt):
-                fs.update(self.first0(p.sub, mark))
-
-            if not self.del_node(p):
-                break
-            p = p.next
+        stack: List[Optional[Node]] = [p]  # graphs still to be visited, the next one on top
+        while stack:
+            p = stack.pop()
+            while p is not None and p.n not in mark:
+                mark.add(p.n)
+                subs: List[Optional[Node]] = []
+                if p.typ == Node.nt:
+                    if p.sym.firstReady:
+                        fs.update(p.sym.first)
+                    else:
+                        subs.append(p.sym.graph)
+                elif p.typ in (Node.t, Node.wt):
+                    fs.add(p.sym.n)
+                elif p.typ == Node.any:
+                    fs.update(p.set_)
+                elif p.typ == Node.alt:
+                    subs.append(p.sub)
+                    subs.append(p.down)
+                elif p.typ in (Node.iter, Node.opt):
+                    subs.append(p.sub)
+
+                if not self.del_node(p):
+                    stack.extend(reversed(subs))
+                    break
+                if subs:  # visit the sub graphs first, then the rest of this graph
+                    stack.append(p.next)
+                    stack.extend(reversed(subs))
+                    break
+                p = p.next
 
         return fs
 
@@ -579,19 +605,26 @@ class Tab:
             sym.firstReady = True
 
     def comp_follow(self, p: Node):
-        while p is not None and p.n in self.visited:
-            self.visited.add(p.n)
-            if p.typ == Node.nt:
-                s = self.first(p.next)
-                p.sym.follow.update(s)
-                if self.del_graph(p.next):
-                    p.sym.nts.add(self.curSy.n)
-            elif p.typ == Node.opt or p.typ == Node.iter:
-                self.comp_follow(p.sub)
-            elif p.typ == Node.alt:
-                self.comp_follow(p.sub)
-                self.comp_follow(p.down)
-            p = p.next
+        stack: List[Optional[Node]] = [p]  # graphs still to be visited, the next one on top
+        while stack:
+            p = stack.pop()
+            while p is not None and p.n not in self.visited:
+                self.visited.add(p.n)
+                if p.typ == Node.nt:
+                    s = self.first(p.next)
+                    p.sym.follow.update(s)
+                    if self.del_graph(p.next):
+                        p.sym.nts.add(self.curSy.n)
+                elif p.typ == Node.opt or p.typ == Node.iter:
+                    stack.append(p.next)
+                    stack.append(p.sub)
+                    break
+                elif p.typ == Node.alt:
+                    stack.append(p.next)
+                    stack.append(p.down)
+                    stack.append(p.sub)
+                    break
+                p = p.next
 
     def complete(self, sym: Symbol):
         if sym.n not in self.visited:
@@ -807,11 +840,15 @@ class Tab:
             c = s[i]
             if c != '\\':
                 buf += c
+                i += 1
                 continue
+            if i + 1 >= len(s):
+                self.parser.sem_err("bad escape sequence in string or character")
+                break
             c = s[i + 1]
             if c in 'ux':
-                if i + 6 < len(s):
-                    buf += self.hex2char(s[i + 2: i + 6])
+                if i + 6 <= len(s):
+                    buf += chr(self.hex2char(s[i + 2: i + 6]))
                     i += 6
                     continue
                 else:
@@ -837,6 +874,7 @@ class Tab:
                 break
 
             buf += cc
+            i += 2
 
         return buf
 
@@ -1152,3 +1190,9 @@ class Tab:
                 self.nsName = value
         elif name == "$checkEOF":
             self.checkEOF = (value == "true")
+        elif name == "$scannerTables":
+            self.scannerTables = (value == "true")
+        elif name == "$scannerRuns":
+            self.scannerRuns = (value == "true")
+        elif name == "$scannerDispatch":
+            self.scannerDispatch = value
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from mmap import mmap, ACCESS_READ
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+
+from .errors import FatalError
+
+
+def fast_comment_args(start: str, stop: str, nested: bool, ignore_case: bool) -> Optional[Tuple[bytes, bytes, bool]]:
+    """ Arguments of Scanner.skip_comment() for a comment, None if its delimiters
+    cannot be searched for as raw bytes (non-ASCII, line breaks, case-insensitive letters)
+    """
+    delimiters = start + stop
+    if any(ord(c) > 127 for c in delimiters) or '\r' in delimiters or '\n' in start:
+        return None
+    if '\n' in stop and stop != '\n':
+        return None
+    if ignore_case and any(c.isalpha() for c in delimiters):
+        return None
+    if nested and start[0] == stop[0]:  # the char-wise loop checks the stop delimiter first
+        return None
+
+    return start.encode(), stop.encode(), nested
+
+
+class ScannerTables:
+    """ The scanner DFA as tables, see DFA.make_tables().
+    Chars are mapped to char classes (chars with the same transitions in every state);
+    table state 0 is the error state and class 0 the class of chars without transitions.
+
+    Binary format (little endian int32 unless noted):
+        header      MAGIC, then the HEADER fields
+        lowClasses  256 classes of the chars < 256
+        highRanges  nHigh (from, to, class) triples for the chars >= 256, sorted
+        trans       nStates * nClasses target states, negative for context transitions
+        accept      nStates token kinds, -1 for non-final states
+        flags       nStates state flags, CTX_STATE | CHECK_LITERAL
+        ignored     nIgnored (from, to) ranges of ignored chars
+        literals    nLiterals (kind, byte length, utf-8 bytes padded to 4 bytes)
+        comments    nComments (nested, byte length of start and stop, utf-8 bytes padded to 4 bytes)
+    The int sections of a loaded file are used in place (memoryview over an mmap)
+    """
+    MAGIC: bytes = b'COCOTAB1'
+    HEADER: struct.Struct = struct.Struct('<8s11i')
+
+    CTX_STATE: int = 1      # state flag: state is reached by a context transition
+    CHECK_LITERAL: int = 2  # state flag: token may be a literal (classLitToken)
+
+    eofSym: int
+    maxT: int
+    noSym: int
+    ignore_case: bool
+    start_state: int
+    n_states: int
+    n_classes: int
+
+    low_classes: Sequence[int]
+    high_ranges: List[Tuple[int, int, int]]
+    high_starts: List[int]  # from of the high ranges, for bisection
+    trans: Sequence[int]
+    accept: Sequence[int]
+    flags: Sequence[int]
+    ignored: List[Tuple[int, int]]
+    literals: Dict[int, Dict[str, int]]  # literal kinds by string, bucketed by string length
+    comments: List[Tuple[str, str, bool]]
+    data: Optional[Union[bytes, mmap]]  # keeps the mapped file of load() open
+
+    def __init__(self):
+        self.eofSym = self.maxT = self.noSym = 0
+        self.ignore_case = False
+        self.start_state = 1
+        self.n_states = self.n_classes = 1
+        self.low_classes = array('i', [0] * 256)
+        self.high_ranges = []
+        self.high_starts = []
+        self.trans = array('i', [0])
+        self.accept = array('i', [-1])
+        self.flags = array('i', [0])
+        self.ignored = []
+        self.literals = {}
+        self.comments = []
+        self.data = None
+
+    def char_class(self, ch: int) -> int:
+        if ch < 256:
+            return self.low_classes[ch]
+
+        i = bisect_right(self.high_starts, ch) - 1
+        if i >= 0 and ch <= self.high_ranges[i][1]:
+            return self.high_ranges[i][2]
+        return 0
+
+    # -------------------------- writing ---------------------------
+
+    @staticmethod
+    def _ints(values: Sequence[int]) -> bytes:
+        a = array('i', values)
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a.tobytes()
+
+    @staticmethod
+    def _padded(data: bytes) -> bytes:
+        return data + b'\0' * (-len(data) % 4)
+
+    def to_bytes(self) -> bytes:
+        literals = [(kind, name) for bucket in self.literals.values() for name, kind in bucket.items()]
+        parts = [
+            self.HEADER.pack(self.MAGIC, self.eofSym, self.maxT, self.noSym, int(self.ignore_case),
+                             self.start_state, self.n_states, self.n_classes, len(self.high_ranges),
+                             len(self.ignored), len(literals), len(self.comments)),
+            self._ints(self.low_classes),
+            self._ints([x for r in self.high_ranges for x in r]),
+            self._ints(self.trans),
+            self._ints(self.accept),
+            self._ints(self.flags),
+            self._ints([x for r in self.ignored for x in r]),
+        ]
+        for kind, name in literals:
+            data = name.encode('utf-8')
+            parts.append(self._ints([kind, len(data)]) + self._padded(data))
+        for start, stop, nested in self.comments:
+            start_data, stop_data = start.encode('utf-8'), stop.encode('utf-8')
+            parts.append(self._ints([int(nested), len(start_data), len(stop_data)]) +
+                         self._padded(start_data + stop_data))
+
+        return b''.join(parts)
+
+    def write(self, f: Union[str, BinaryIO]):
+        if isinstance(f, str):
+            try:
+                with open(f, 'wb') as file:
+                    file.write(self.to_bytes())
+            except OSError:
+                raise FatalError("Cannot generate scanner tables {}".format(f))
+        else:
+            f.write(self.to_bytes())
+
+    # -------------------------- loading ---------------------------
+
+    @classmethod
+    def load(cls, path: str) -> 'ScannerTables':
+        """ Maps the tables file into memory; the int tables are not copied
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = mmap(f.fileno(), 0, access=ACCESS_READ)
+        except (OSError, ValueError):
+            raise FatalError("Cannot open scanner tables {}".format(path))
+
+        return cls.from_buffer(data)
+
+    @classmethod
+    def from_buffer(cls, data: Union[bytes, mmap]) -> 'ScannerTables':
+        if len(data) < cls.HEADER.size or data[:len(cls.MAGIC)] != cls.MAGIC:
+            raise FatalError("Not a scanner tables file")
+
+        t = cls()
+        t.data = data
+        (_, t.eofSym, t.maxT, t.noSym, ignore_case, t.start_state, t.n_states, t.n_classes,
+         n_high, n_ignored, n_literals, n_comments) = cls.HEADER.unpack_from(data)
+        t.ignore_case = bool(ignore_case)
+
+        view = memoryview(data)
+        pos = cls.HEADER.size
+
+        def ints(n: int) -> Sequence[int]:
+            nonlocal pos
+            section = view[pos:pos + 4 * n]
+            pos += 4 * n
+            if sys.byteorder == 'little':
+                return section.cast('i')
+            a = array('i', bytes(section))
+            a.byteswap()
+            return a
+
+        def text(n: int) -> bytes:
+            nonlocal pos
+            s = bytes(view[pos:pos + n])
+            pos += n + (-n % 4)
+            return s
+
+        t.low_classes = ints(256)
+        high = ints(3 * n_high)
+        t.high_ranges = [(high[i], high[i + 1], high[i + 2]) for i in range(0, len(high), 3)]
+        t.high_starts = [r[0] for r in t.high_ranges]
+        t.trans = ints(t.n_states * t.n_classes)
+        t.accept = ints(t.n_states)
+        t.flags = ints(t.n_states)
+        ignored = ints(2 * n_ignored)
+        t.ignored = [(ignored[i], ignored[i + 1]) for i in range(0, len(ignored), 2)]
+
+        for _ in range(n_literals):
+            kind, length = ints(2)
+            name = text(length).decode('utf-8')
+            t.literals.setdefault(len(name), {})[name] = kind
+
+        for _ in range(n_comments):
+            nested, start_len, stop_len = ints(3)
+            both = text(start_len + stop_len)
+            t.comments.append((both[:start_len].decode('utf-8'), both[start_len:].decode('utf-8'), bool(nested)))
+
+        return t
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from Coco.charset import CharSet, Range
+from Coco.dfa import DFA, Comment
+from Coco.errors import Errors, FatalError
+from Coco.runtime import TableScanner
+from Coco.tab import Node, Symbol, Tab
+from Coco.tables import ScannerTables
+
+
+def new_dfa():
+    """ A DFA with an empty symbol table; Tab() itself needs a parser """
+    tab = Tab.__new__(Tab)
+    tab.classes = []
+    tab.terminals = []
+    tab.pragmas = []
+    tab.literals = {}
+    tab.ignored = CharSet()
+    dfa = DFA()
+    dfa.DFA(SimpleNamespace(tab=tab, errors=Errors(), trace=None))
+    return dfa
+
+
+def char_set(*ranges):
+    sets = []
+    for from_, to in ranges:
+        s = CharSet()
+        s.ranges = [Range(from_, to)]
+        sets.append(s)
+    return CharSet.union(sets)
+
+
+def new_symbol(name, n, kind=Symbol.fixedToken):
+    sym = Symbol(Node.t, name, 0)
+    sym.n = n
+    sym.tokenKind = kind
+    return sym
+
+
+def add_transition(dfa, from_, to, chars, tc=Node.normalTrans):
+    """ Transition for a char (int) or a char class ((from, to) ranges) """
+    if isinstance(chars, int):
+        dfa.new_transition(from_, to, Node.chr, chars, tc)
+    else:
+        dfa.new_transition(from_, to, Node.clas, dfa.tab.new_CharClass('c', char_set(*chars)).n, tc)
+
+
+def linear_find_action(dfa, state, ch):
+    """ find_action() as a search through the actions in their order """
+    for a in state.actions:
+        if a.typ == Node.chr and a.sym == ch or a.typ == Node.clas and dfa.tab.CharClass_set(a.sym).get(ch):
+            return a
+    return None
+
+
+def random_ranges(rnd, n, ids):
+    ranges = []
+    for _ in range(n):
+        from_ = rnd.randint(0, 60)
+        ranges.append((from_, from_ + rnd.randint(0, 10), rnd.randrange(ids)))
+    return ranges
+
+
+def test_partition():
+    rnd = random.Random(41)
+    assert DFA.partition([]) == []
+    for _ in range(300):
+        ranges = random_ranges(rnd, rnd.randint(1, 6), 4)
+        intervals = DFA.partition(ranges)
+        for (_, to, _), (from_, _, _) in zip(intervals, intervals[1:]):
+            assert to < from_
+        covered = {ch: covering for from_, to, covering in intervals for ch in range(from_, to + 1)}
+        for ch in range(80):
+            expected = {i for from_, to, i in ranges if from_ <= ch <= to}
+            assert covered.get(ch, set()) == expected, (ranges, ch)
+
+
+def test_find_action():
+    rnd = random.Random(41)
+    dfa = new_dfa()
+    dfa.curSy = new_symbol('x', 1)
+    for _ in range(100):
+        state, target = dfa.new_state(), dfa.new_state()
+        for _ in range(rnd.randint(0, 8)):
+            if rnd.random() < 0.5:
+                add_transition(dfa, state, target, rnd.choice([rnd.randint(0, 80), 0x10FFFF]))
+            else:
+                add_transition(dfa, state, target, [r[:2] for r in random_ranges(rnd, rnd.randint(1, 3), 1)])
+        for ch in list(range(90)) + [0xFFFF, 0x10FFFF]:
+            assert dfa.find_action(state, ch) is linear_find_action(dfa, state, ch)
+
+        add_transition(dfa, state, target, 85)  # the index is rebuilt for new actions
+        assert dfa.find_action(state, 85) is linear_find_action(dfa, state, 85)
+
+
+def set_chars(s):
+    return {ch for r in s.ranges for ch in range(r.from_, r.to + 1)}
+
+
+def test_charset_set():
+    rnd = random.Random(43)
+    for _ in range(300):
+        s, chars = CharSet(), set()
+        for _ in range(rnd.randint(0, 20)):
+            ch = rnd.randint(0, 30)
+            s.set(ch)
+            chars.add(ch)
+            assert set_chars(s) == chars
+            for r, next_ in zip(s.ranges, s.ranges[1:]):
+                assert r.to + 1 < next_.from_  # sorted and merged
+
+
+def test_make_unique():
+    rnd = random.Random(43)
+    dfa = new_dfa()
+    dfa.curSy = new_symbol('x', 1)
+    for _ in range(200):
+        state = dfa.new_state()
+        targets = [dfa.new_state() for _ in range(3)]
+        for _ in range(rnd.randint(1, 6)):
+            tc = Node.contextTrans if rnd.random() < 0.2 else Node.normalTrans
+            chars = rnd.randint(0, 40) if rnd.random() < 0.5 else [r[:2] for r in random_ranges(rnd, 2, 1)]
+            add_transition(dfa, state, rnd.choice(targets), chars, tc)
+        expected = {}
+        for ch in range(80):
+            covering = [a for a in state.actions if ch in set_chars(a.symbols(dfa.tab))]
+            if covering:
+                expected[ch] = (sorted({t.nr for a in covering for t in a.targets}),
+                                any(a.tc == Node.contextTrans for a in covering))
+
+        dfa.make_unique(state)
+        seen = set()
+        for a in state.actions:
+            chars = set_chars(a.symbols(dfa.tab))
+            assert not chars & seen  # the actions are disjoint
+            seen |= chars
+        for ch in range(80):
+            a = dfa.find_action(state, ch)
+            assert (a is None and ch not in expected or
+                    ([t.nr for t in a.targets], a.tc == Node.contextTrans) == expected[ch]), ch
+
+
+def test_charset_union():
+    rnd = random.Random(44)
+    assert CharSet.union([]).ranges == []
+    for _ in range(300):
+        sets = [char_set(*[r[:2] for r in random_ranges(rnd, rnd.randint(0, 3), 1)]) for _ in range(rnd.randint(1, 4))]
+        union = CharSet.union(sets)
+        assert set_chars(union) == set().union(*map(set_chars, sets))
+        for r, next_ in zip(union.ranges, union.ranges[1:]):
+            assert r.to + 1 < next_.from_
+
+        s = sets[0].clone()
+        s.or_(sets[-1])
+        assert set_chars(s) == set_chars(sets[0]) | set_chars(sets[-1])
+
+
+def test_combine_shifts():
+    rnd = random.Random(44)
+    dfa = new_dfa()
+    dfa.curSy = new_symbol('x', 1)
+    states = []
+    for _ in range(100):
+        state = dfa.new_state()
+        targets = [dfa.new_state() for _ in range(3)]
+        ch = 0
+        while ch < 80:  # disjoint runs of chars with single targets, as after melting
+            to = min(ch + rnd.randint(0, 5), 79)
+            if rnd.random() < 0.8:
+                target, tc = rnd.choice(targets), rnd.choice([Node.normalTrans, Node.contextTrans])
+                if to == ch or rnd.random() < 0.3:
+                    for c in range(ch, to + 1):
+                        add_transition(dfa, state, target, c, tc)
+                else:
+                    add_transition(dfa, state, target, [(ch, to)], tc)
+            ch = to + 1
+        states.append((state, {ch: dfa.find_action(state, ch) for ch in range(80)}))
+
+    moves = [{ch: a and (a.targets, a.tc) for ch, a in actions.items()} for _, actions in states]
+    dfa.combine_shifts()
+    for (state, _), expected in zip(states, moves):
+        keys = [(a.targets, a.tc) for a in state.actions]
+        assert len(keys) == len(set(keys))  # one action per target and transition code
+        for ch in range(80):
+            a = dfa.find_action(state, ch)
+            assert (a and (a.targets, a.tc)) == expected[ch]
+
+
+EOF_, IDENT, NUMBER, FLOAT, DOTS, DOT, ARROW, MINUS, IF, NO_SYM = range(10)
+
+
+def token_dfa():
+    """ The DFA of the tokens
+        ident  = letter {letter | digit}.        letter: a-z, A-Z, _, greek letters
+        number = digit {digit} | digit {digit} CONTEXT("..").
+        float  = digit {digit} '.' {digit}.
+        dots = "..".  dot = ".".  arrow = "-->".  minus = "-".  if = "if".
+    with nested /* */ comments; "--" makes the scanner fall back to "-"
+    """
+    dfa = new_dfa()
+    names = ['EOF', 'ident', 'number', 'float', '".."', '"."', '"-->"', '"-"', '"if"', '???']
+    kinds = [Symbol.fixedToken, Symbol.classLitToken, Symbol.classToken, Symbol.classToken] + [Symbol.litToken] * 5
+    dfa.tab.terminals = [new_symbol(name, n, kind) for n, (name, kind) in enumerate(zip(names, kinds + [0]))]
+    dfa.tab.noSym = dfa.tab.terminals[NO_SYM]
+    dfa.tab.ignored = char_set((9, 10), (13, 13), (32, 32))
+    dfa.first_comment = Comment('/*', '*/', True)
+    letter = [(65, 90), (95, 95), (97, 122), (0x3B1, 0x3C9)]
+    digit = [(48, 57)]
+
+    def states(*end_of):
+        result = [dfa.new_state() for _ in end_of]
+        for state, kind in zip(result, end_of):
+            state.endOf = None if kind is None else dfa.tab.terminals[kind]
+        return result
+
+    start = dfa._first_state
+    dfa.curSy = dfa.tab.terminals[IDENT]
+    s1, = states(IDENT)
+    add_transition(dfa, start, s1, letter)
+    add_transition(dfa, s1, s1, letter + digit)
+
+    dfa.curSy = dfa.tab.terminals[NUMBER]
+    s2, s3, s4, s5 = states(NUMBER, None, None, NUMBER)
+    add_transition(dfa, start, s2, digit)
+    add_transition(dfa, s2, s2, digit)
+    add_transition(dfa, start, s3, digit)
+    add_transition(dfa, s3, s3, digit)
+    add_transition(dfa, s3, s4, ord('.'), Node.contextTrans)
+    add_transition(dfa, s4, s5, ord('.'), Node.contextTrans)
+
+    dfa.curSy = dfa.tab.terminals[FLOAT]
+    s6, s7 = states(None, FLOAT)
+    add_transition(dfa, start, s6, digit)
+    add_transition(dfa, s6, s6, digit)
+    add_transition(dfa, s6, s7, ord('.'))
+    add_transition(dfa, s7, s7, digit)
+
+    for kind, text in [(DOTS, '..'), (DOT, '.'), (ARROW, '-->'), (MINUS, '-')]:
+        dfa.curSy = dfa.tab.terminals[kind]
+        chain = states(*[None] * (len(text) - 1) + [kind])
+        for from_, to, ch in zip([start] + chain, chain, text):
+            add_transition(dfa, from_, to, ord(ch))
+
+    for sym in dfa.tab.terminals:  # new_transition() made all of them class tokens
+        sym.tokenKind = Symbol.litToken if sym.name.startswith('"') else Symbol.classToken
+    dfa.tab.terminals[IDENT].tokenKind = Symbol.classLitToken
+    dfa.make_deterministic()
+    return dfa
+
+
+def table_state_numbers(dfa):
+    return {state: i + 1 for i, state in enumerate(dfa.states())}
+
+
+def test_tables_round_trip(tmp_path):
+    dfa = token_dfa()
+    tables = dfa.make_tables()
+    path = str(tmp_path / 'tokens.tables')
+    dfa.write_tables(path)
+
+    for loaded in (ScannerTables.load(path), ScannerTables.from_buffer(tables.to_bytes())):
+        assert loaded.to_bytes() == tables.to_bytes()
+        for name in ('eofSym', 'maxT', 'noSym', 'ignore_case', 'start_state', 'n_states', 'n_classes',
+                     'high_ranges', 'high_starts', 'ignored', 'literals', 'comments'):
+            assert getattr(loaded, name) == getattr(tables, name), name
+        for name in ('low_classes', 'trans', 'accept', 'flags'):
+            assert list(getattr(loaded, name)) == list(getattr(tables, name)), name
+
+        assert loaded.literals == {1: {'.': DOT, '-': MINUS}, 2: {'..': DOTS, 'if': IF}, 3: {'-->': ARROW}}
+        assert loaded.comments == [('/*', '*/', True)]
+        assert loaded.high_ranges and any(flag & ScannerTables.CTX_STATE for flag in loaded.flags)
+        assert any(flag & ScannerTables.CHECK_LITERAL for flag in loaded.flags)
+        numbers = table_state_numbers(dfa)
+        for state, nr in numbers.items():
+            assert loaded.accept[nr] == (-1 if state.endOf is None else state.endOf.n)
+            for ch in list(range(300)) + [0x3B0, 0x3B1, 0x3C9, 0x3CA, 0xFFFF, 0x10FFFF]:
+                a = dfa.find_action(state, ch)
+                target = 0 if a is None else numbers[a.targets[0]] * (-1 if a.tc == Node.contextTrans else 1)
+                assert loaded.trans[nr * loaded.n_classes + loaded.char_class(ch)] == target, (nr, ch)
+
+
+def test_tables_errors(tmp_path):
+    with pytest.raises(FatalError):
+        ScannerTables.from_buffer(b'COCOTAB0' + bytes(ScannerTables.HEADER.size))
+    with pytest.raises(FatalError):
+        ScannerTables.from_buffer(ScannerTables.MAGIC)
+    with pytest.raises(FatalError):
+        ScannerTables.load(str(tmp_path / 'missing.tables'))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1..5', [(NUMBER, '1'), (DOTS, '..'), (NUMBER, '5')]),  # CONTEXT("..") cuts off the appendix
+    ('12.5 12. 7', [(FLOAT, '12.5'), (FLOAT, '12.'), (NUMBER, '7')]),
+    ('1.x 3..', [(FLOAT, '1.'), (IDENT, 'x'), (NUMBER, '3'), (DOTS, '..')]),
+    ('--x -->-', [(MINUS, '-'), (MINUS, '-'), (IDENT, 'x'), (ARROW, '-->'), (MINUS, '-')]),  # "--" falls back
+    ('if iff αβγ_1', [(IF, 'if'), (IDENT, 'iff'), (IDENT, 'αβγ_1')]),
+    ('a /* x /* y */ z */ . b', [(IDENT, 'a'), (DOT, '.'), (IDENT, 'b')]),
+    ('a ? b', [(IDENT, 'a'), (NO_SYM, '?'), (IDENT, 'b')]),
+])
+def test_table_scanner(text, expected):
+    tables = token_dfa().make_tables()
+    tokens = [(t.kind, t.val) for t in TableScanner(text.encode('utf-8-sig'), tables=tables).tokens()]
+    assert tokens == expected + [(EOF_, '')]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+
+import pytest
+
+from Coco.parser import Parser
+from Coco.scanner import Scanner, Token
+
+
+def attribute_parser(data):
+    parser = Parser(Scanner(data))
+    parser.la = Token()
+    parser.get()
+    return parser
+
+
+@pytest.mark.parametrize('bom', [b'', b'\xef\xbb\xbf'])
+def test_attribute_types_are_utf8(bom):
+    sym = SimpleNamespace()
+    attribute_parser(bom + '<out Menú x>'.encode()).attr_decl(sym)
+    assert (sym.retType, sym.retVar) == ('Menú ', 'x')
+
+    node = SimpleNamespace(pos=None)
+    attribute_parser(bom + '<out "größe">'.encode()).attribs(node)
+    assert node.retVar == '"größe"'
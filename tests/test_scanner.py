@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import random
+import textwrap
+
+import pytest
+
+from Coco.buffer import Buffer
+from Coco.dfa import DFA, Comment
+from Coco.errors import FatalError
+from Coco.parallel import tokenize_parallel
+from Coco.runtime import TableScanner
+from Coco.scanner import AsyncScanner, Scanner
+from Coco.tables import ScannerTables
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+def test_token_array_val_latin1():
+    # no byte order mark: one char per byte, the bytes of 'é' and '©' are two tokens' worth of chars
+    data = 'café ©x "ü" IF'.encode('utf-8')
+    tokens = Scanner(data).tokenize_all()
+    columns = Scanner(data).tokenize_all(columnar=True)
+    assert [columns.val(i) for i in range(len(columns))] == [t.val for t in tokens]
+    assert any(ord(c) >= 0x80 for t in tokens for c in t.val)
+
+
+def test_token_array_val_utf8():
+    data = UTF8_BOM + 'café ©x "ü" IF'.encode('utf-8')
+    tokens = Scanner(data).tokenize_all()
+    columns = Scanner(data).tokenize_all(columnar=True)
+    assert [columns.val(i) for i in range(len(columns))] == [t.val for t in tokens]
+    assert tokens[0].val == 'café'
+
+
+def test_tokenize_columnar_after_peek():
+    data = 'café naïve "é" x'.encode('utf-8')  # no byte order mark: é is two chars of one byte each
+    expected = Scanner(data).tokenize_all(columnar=True)
+    scanner = Scanner(data)
+    scanner.peek(3)
+    columns = scanner.tokenize_all(columnar=True)
+    assert list(columns.end) == list(expected.end)
+    assert [columns.val(i) for i in range(len(columns))] == [expected.val(i) for i in range(len(expected))]
+
+
+def test_peek_skips_pragmas_without_using_capacity():
+    scanner = Scanner(b'a $A b $B $C c d e', max_peek=3)
+    assert scanner.peek().val == 'a'
+    scanner.reset_peek()
+    assert scanner.peek(2).val == 'b'
+    scanner.reset_peek()
+    assert scanner.peek(3).val == 'c'
+    assert [scanner.scan().val for _ in range(6)] == ['a', '$A', 'b', '$B', '$C', 'c']
+    assert scanner.peek(3).val == ''  # EOF
+
+
+def test_peek_limit():
+    scanner = Scanner(b'a b c d e', max_peek=3)
+    assert scanner.peek(3).val == 'c'
+    scanner.reset_peek()
+    with pytest.raises(FatalError):
+        scanner.peek(4)
+
+
+@pytest.mark.parametrize('data', [
+    b'a  b\n\n  c /* x\ny */ d // z\r\ne\r\n  f',
+    UTF8_BOM + 'é  x\n /* ü\n */ yy\n\tz'.encode('utf-8'),
+])
+def test_untracked_lines(data):
+    tracked = Scanner(data).tokenize_all()
+    scanner = Scanner(data, track_lines=False)
+    untracked = scanner.tokenize_all()
+    assert [(t.kind, t.pos, t.val) for t in untracked] == [(t.kind, t.pos, t.val) for t in tracked]
+    assert all(t.line == t.col == t.charPos == 0 for t in untracked)
+    assert [scanner.line_col(t.pos) for t in untracked[:-1]] == [(t.line, t.col) for t in tracked[:-1]]
+
+
+class CharwiseScanner(Scanner):
+    """ Skips comments with the char-wise loops only """
+    def skip_comment(self, start, stop, nested, line0):
+        return False
+
+
+def comment_tokens(scanner):
+    return [(t.kind, t.pos, t.val, t.line, t.col, t.charPos) for t in scanner.tokens()]
+
+
+@pytest.mark.parametrize('data', [
+    b'/* /*/ */ */ x',
+    b'/**( //*/ a */ b',
+    b'/*\t/*/ c */ */ d',
+    b'/* */*/ e',
+    b'/* /* */*/ f',
+])
+def test_nested_comment_overlapping_delimiters(data):
+    assert comment_tokens(Scanner(data)) == comment_tokens(CharwiseScanner(data))
+
+
+def test_nested_comments_random():
+    rnd = random.Random(34)
+    for _ in range(2000):
+        data = ''.join(rnd.choice('/*( \nx') for _ in range(rnd.randint(0, 30))).encode()
+        assert comment_tokens(Scanner(data)) == comment_tokens(CharwiseScanner(data)), data
+
+
+def comment_tables(comments):
+    tables = ScannerTables()
+    tables.n_states = 2  # start state 1 without transitions: every char is a noSym token
+    tables.trans = [0, 0]
+    tables.accept = [-1, -1]
+    tables.flags = [0, 0]
+    tables.noSym = tables.maxT = 1
+    tables.comments = comments
+    return tables
+
+
+@pytest.mark.parametrize('start, stop', [('(*', '*)'), ('ab', 'ac'), ('<', '>'), ('a', 'ab')])
+def test_table_scanner_nested_comments(start, stop):
+    rnd = random.Random(start + stop)
+    tables = comment_tables([(start, stop, True)])
+    fast = TableScanner(b'', tables=tables)
+    chars = sorted(set(start + stop + ' x'))
+    inputs = [(start + ' ' + start + stop + ' ' + stop + ' x').encode(), (start + start + stop + stop + 'x').encode()]
+    for _ in range(2000):
+        inputs.append(''.join(rnd.choice(chars) for _ in range(rnd.randint(0, 20))).encode())
+    for data in inputs:
+        slow = TableScanner(data, tables=tables)
+        slow.comments = {c: [spec[:3] + (None,) for spec in specs] for c, specs in fast.comments.items()}
+        assert comment_tokens(TableScanner(data, tables=tables)) == comment_tokens(slow), data
+
+
+def generated_comment(start, stop, nested):
+    """ The comment0() method the scanner generator writes for a comment """
+    dfa = DFA()
+    dfa.ignore_case = False
+    dfa.gen = io.StringIO()
+    dfa.gen_comment(Comment(start, stop, nested), 0)
+    namespace = {'Buffer': Buffer}
+    exec(textwrap.dedent(dfa.gen.getvalue()), namespace)
+    return namespace['comment0']
+
+
+@pytest.mark.parametrize('start, stop, nested', [
+    ('/*', '*/', True), ('(*', '*)', False), ('<', '>', True), ('a', 'ab', True), ('//', '\n', False),
+])
+def test_generated_comment(start, stop, nested):
+    rnd = random.Random(start + stop)
+    generated = type('GeneratedScanner', (Scanner,), {'comment0': generated_comment(start, stop, nested)})
+    tables = comment_tables([(start, stop, nested)])
+    chars = sorted(set(start + stop + ' x\n'))
+    for _ in range(1000):
+        data = (start + ''.join(rnd.choice(chars) for _ in range(rnd.randint(0, 20)))).encode()
+        expected = TableScanner(data, tables=tables)
+        scanner = generated(data)
+        assert scanner.comment0() == expected.comment(*expected.comments[ord(start[0])][0]), data
+        assert (scanner.pos, scanner.line, scanner.col) == (expected.pos, expected.line, expected.col), data
+
+
+def literal_tables():
+    """ Tables for the tokens a (1), b (2), c (3) and abcd (4): the scanner reads 'abc'
+    up to the char behind it before it falls back to 'a'
+    """
+    tables = ScannerTables()
+    tables.n_states, tables.n_classes = 8, 5
+    tables.low_classes = [0] * 256
+    for cls, ch in enumerate('abcd', 1):
+        tables.low_classes[ord(ch)] = cls
+    tables.trans = [0] * 8 * 5
+    for state, cls, target in [(1, 1, 2), (1, 2, 6), (1, 3, 7), (2, 2, 3), (3, 3, 4), (4, 4, 5)]:
+        tables.trans[state * 5 + cls] = target
+    tables.accept = [-1, -1, 1, -1, -1, 4, 2, 3]
+    tables.flags = [0] * 8
+    tables.ignored = [(32, 32)]
+    tables.maxT = tables.noSym = 5
+    return tables
+
+
+def token_columns(tokens):
+    return [list(getattr(tokens, name)) for name in ('kind', 'pos', 'end', 'reach', 'charPos', 'line', 'col')]
+
+
+def assert_relex(scanner_cls, source, offset, deleted, inserted, **kwargs):
+    old = scanner_cls(source, **kwargs).tokenize_all(columnar=True)
+    new = source[:offset] + inserted + source[offset + deleted:]
+    result = scanner_cls.relex(old, new, offset, deleted, len(inserted), **kwargs)
+    assert token_columns(result) == token_columns(scanner_cls(new, **kwargs).tokenize_all(columnar=True)), new
+
+
+class LiteralScanner(TableScanner):
+    tables = literal_tables()
+
+
+def test_relex_behind_fallback():
+    old = LiteralScanner(b'abc').tokenize_all(columnar=True)
+    assert list(old.kind) == [1, 2, 3, 0]
+    assert list(old.reach) == [3, 3, 3, 3]  # scanning 'a' read up to the end
+    assert_relex(LiteralScanner, b'abc', 3, 0, b'd')
+    assert_relex(LiteralScanner, b'ab cab', 6, 0, b'cd')
+
+
+def test_relex_random_edits():
+    rnd = random.Random(38)
+    pieces = [b'a', b'b', b'c', b'd', b' ', b'abc']
+    for _ in range(500):
+        source = b''.join(rnd.choice(pieces) for _ in range(rnd.randint(0, 12)))
+        offset = rnd.randint(0, len(source))
+        deleted = rnd.randint(0, len(source) - offset)
+        inserted = b''.join(rnd.choice(pieces) for _ in range(rnd.randint(0, 2)))
+        assert_relex(LiteralScanner, source, offset, deleted, inserted)
+
+    pieces = [b'x', b' ', b'\n', b'/*', b'*/', b'//', b'"', b'(.', b'.)', b'..', b'12', b'\r\n']
+    for _ in range(500):
+        source = b''.join(rnd.choice(pieces) for _ in range(rnd.randint(0, 12)))
+        offset = rnd.randint(0, len(source))
+        deleted = rnd.randint(0, len(source) - offset)
+        inserted = b''.join(rnd.choice(pieces) for _ in range(rnd.randint(0, 2)))
+        assert_relex(Scanner, source, offset, deleted, inserted)
+
+
+@pytest.mark.parametrize('track_lines', [True, False])
+def test_tokenize_parallel(tmp_path, track_lines):
+    path = tmp_path / 'input.atg'
+    path.write_bytes(b'x = "a" /* comment\n over lines */ y\r\n' * 40 + 'é ü\n'.encode() * 20 + b'(. z .)\n' * 40)
+    expected = Scanner(str(path), track_lines=track_lines).tokenize_all(columnar=True)
+    for chunk_size in (16, 100):
+        result = tokenize_parallel(Scanner, str(path), 2, chunk_size, track_lines=track_lines)
+        assert token_columns(result) == token_columns(expected)
+
+
+async def scan_chunked(data, sizes):
+    """ Tokens of an AsyncScanner whose input arrives in chunks of the given sizes """
+    reader = asyncio.StreamReader()
+
+    async def feed():
+        i = 0
+        for size in sizes:
+            reader.feed_data(data[i:i + size])
+            i += size
+            await asyncio.sleep(0)
+        reader.feed_data(data[i:])
+        reader.feed_eof()
+
+    task = asyncio.ensure_future(feed())
+    tokens = [(t.kind, t.pos, t.val, t.line, t.col, t.charPos) async for t in AsyncScanner(Scanner, reader).tokens()]
+    await task
+    return tokens
+
+
+@pytest.mark.parametrize('data', [
+    b'COMPILER x /* a\r\ncomment */ "str" \'c\' 123 (. sem .) <. attr .> ident_1 END x.',
+    b'\xef\xbb\xbf' + 'ident é "ü" /* ß */ x'.encode(),
+    b'',
+])
+def test_async_scanner(data):
+    expected = comment_tokens(Scanner(data))
+    rnd = random.Random(40)
+    for sizes in [[1] * len(data), [2, 3] * len(data), [len(data)]]:
+        assert asyncio.run(scan_chunked(data, sizes)) == expected
+    for _ in range(20):
+        assert asyncio.run(scan_chunked(data, [rnd.randint(1, 8) for _ in range(len(data))])) == expected